@@ -0,0 +1,34 @@
+"""add users.token_version
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-16 00:00:00
+"""
+
+from typing import Sequence, Union
+
+import sqlalchemy as sa
+
+from alembic import context, op
+
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 新库由 create_all 建表时已经包含该列，只有旧库需要补充
+    if not context.is_offline_mode():
+        columns = sa.inspect(op.get_bind()).get_columns("users")
+        if any(column["name"] == "token_version" for column in columns):
+            return
+
+    op.add_column(
+        "users",
+        sa.Column("token_version", sa.Integer(), nullable=False, server_default="0"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_column("users", "token_version")
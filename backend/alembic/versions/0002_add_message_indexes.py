@@ -0,0 +1,46 @@
+"""add messages private/created indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-16 00:00:00
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 models.Message.__table_args__ 中的定义保持一致
+INDEXES = (
+    ("idx_message_private", ["from_user_id", "to_user_id", "created_at"]),
+    ("idx_message_created", ["created_at"]),
+)
+
+
+def upgrade() -> None:
+    # CONCURRENTLY 建索引不锁写入，但不能在事务中执行，需要放在自动提交块里；
+    # 新库由 create_all 建表时已经包含这些索引，因此使用 IF NOT EXISTS
+    with op.get_context().autocommit_block():
+        for name, columns in INDEXES:
+            op.create_index(
+                name,
+                "messages",
+                columns,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        for name, _ in INDEXES:
+            op.drop_index(
+                name,
+                table_name="messages",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -4,30 +4,50 @@ ChatSphere 聊天室主应用
 """
 import asyncio
 import logging
+import time
 from contextlib import asynccontextmanager
-from datetime import datetime
-
-from fastapi import Depends, FastAPI, HTTPException, WebSocket, WebSocketDisconnect, status
+from datetime import datetime, timedelta
+from typing import Literal, Optional
+
+import orjson
+from cachetools import TTLCache
+from fastapi import (
+    FastAPI,
+    HTTPException,
+    Response,
+    WebSocket,
+    WebSocketDisconnect,
+    status,
+)
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import and_, desc, func, or_, select, union_all
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
 # 导入路由
 from src.chatSphere.api.routes.auth import router as auth_router
-from src.chatSphere.core.auth import get_current_active_user, get_optional_user
+from src.chatSphere.core.auth import CurrentUser, auth_manager, get_optional_user, oauth_manager
+from src.chatSphere.core.auth_cache import cache_auth, get_cached_payload
 from src.chatSphere.core.cache import cache_manager, check_redis_health
 from src.chatSphere.core.config import is_development, settings
-from src.chatSphere.core.database import check_database_health, db_manager, get_db
+from src.chatSphere.core.database import DbSession, check_database_health, db_manager
 from src.chatSphere.core.logging_config import setup_logging
 from src.chatSphere.core.middleware import WebSocketConnectionMiddleware, setup_middleware
 from src.chatSphere.core.models import ChatType, Group, Message, MessageType, Room, User
 from src.chatSphere.core.websocket_manager import ConnectionManager
+from src.chatSphere.services.conversation_service import (
+    get_user_conversations_with_details,
+    mark_conversation_as_read,
+)
 from src.chatSphere.services.responses import (
+    HTTP_EXCEPTION_CODES,
     HTTP_STATUS_MAP,
     ApiResponse,
     ResponseCode,
     ResponseMessage,
+    format_field_error,
     format_validation_errors,
 )
 
@@ -38,59 +58,63 @@ logger = logging.getLogger(__name__)
 # 全局连接管理器
 connection_manager = ConnectionManager()
 
+# 热路径上频繁使用的函数绑定到模块级名称
+_utcnow = datetime.utcnow
+
+# 秒级精度的ISO时间字符串缓存，同一秒内的请求复用同一个字符串
+_ts_cache = {"t": 0, "s": ""}
+
+
+def now_iso() -> str:
+    """当前UTC时间的ISO字符串（秒级精度）"""
+    t = int(time.time())
+    if t != _ts_cache["t"]:
+        _ts_cache["t"] = t
+        _ts_cache["s"] = datetime.utcfromtimestamp(t).isoformat()
+    return _ts_cache["s"]
+
 
 async def create_default_rooms_if_not_exist():
     """创建默认房间（如果不存在）"""
-    from sqlalchemy import select
-
-    async for session in get_db():
-        try:
-            # 检查是否已存在默认房间
-            result = await session.execute(select(Room).where(Room.id == "general"))
-            existing_room = result.scalar_one_or_none()
-
-            if existing_room:
-                logger.info("默认房间已存在，跳过创建")
-                return
-
-            # 创建默认房间
-            rooms_data = [
-                {
-                    "id": "general",
-                    "name": "公共大厅",
-                    "description": "欢迎来到 ChatSphere！这里是公共聊天区域。",
-                    "is_public": True,
-                    "max_members": 1000,
-                },
-                {
-                    "id": "tech",
-                    "name": "技术讨论",
-                    "description": "讨论技术话题的专属房间",
-                    "is_public": True,
-                    "max_members": 500,
-                },
-                {
-                    "id": "random",
-                    "name": "随便聊聊",
-                    "description": "轻松愉快的闲聊区域",
-                    "is_public": True,
-                    "max_members": 300,
-                },
-            ]
+    rooms_data = [
+        {
+            "id": "general",
+            "name": "公共大厅",
+            "description": "欢迎来到 ChatSphere！这里是公共聊天区域。",
+            "is_public": True,
+            "max_members": 1000,
+        },
+        {
+            "id": "tech",
+            "name": "技术讨论",
+            "description": "讨论技术话题的专属房间",
+            "is_public": True,
+            "max_members": 500,
+        },
+        {
+            "id": "random",
+            "name": "随便聊聊",
+            "description": "轻松愉快的闲聊区域",
+            "is_public": True,
+            "max_members": 300,
+        },
+    ]
 
-            for room_data in rooms_data:
-                room = Room(**room_data)
-                session.add(room)
-                logger.info(f"创建默认房间: {room.name}")
+    try:
+        # 单条 INSERT ... ON CONFLICT DO NOTHING，多个进程同时启动也不会重复创建
+        async with db_manager.get_session() as session:
+            stmt = (
+                pg_insert(Room).values(rooms_data).on_conflict_do_nothing(index_elements=[Room.id])
+            )
+            result = await session.execute(stmt)
 
-            await session.commit()
-            logger.info("默认房间创建完成")
+        if result.rowcount:
+            logger.info("默认房间创建完成，新建 %s 个", result.rowcount)
+        else:
+            logger.info("默认房间已存在，跳过创建")
 
-        except Exception as e:
-            logger.error(f"创建默认房间失败: {e}")
-            await session.rollback()
-        finally:
-            break
+    except Exception as e:
+        logger.error("创建默认房间失败: %s", e)
 
 
 @asynccontextmanager
@@ -102,6 +126,7 @@ async def lifespan(app: FastAPI):
         # 初始化数据库
         await db_manager.initialize()
         await db_manager.create_tables()
+        await db_manager.warm_pool(settings.db_pool_min)
         logger.info("✅ 数据库连接已建立")
 
         # 初始化Redis
@@ -116,12 +141,23 @@ async def lifespan(app: FastAPI):
         await create_default_rooms_if_not_exist()
         logger.info("✅ 默认房间检查完成")
 
+        # 初始化统计计数器
+        await init_stats_counters()
+        logger.info("✅ 统计计数器已初始化")
+
+        # 预热密码哈希进程池
+        try:
+            await auth_manager.warm_hash_pool()
+            logger.info("✅ 密码哈希进程池已预热")
+        except Exception as e:
+            logger.warning("⚠️ 密码哈希进程池预热失败: %s", e)
+
         logger.info("🎉 所有服务启动完成！")
 
         yield
 
     except Exception as e:
-        logger.error(f"❌ 服务启动失败: {e}")
+        logger.error("❌ 服务启动失败: %s", e)
         raise
     finally:
         # 清理资源
@@ -131,9 +167,11 @@ async def lifespan(app: FastAPI):
             await connection_manager.disconnect_all()
             await cache_manager.close()
             await db_manager.close()
+            auth_manager.close_hash_pool()
+            await oauth_manager.close()
             logger.info("✅ 所有资源已清理")
         except Exception as e:
-            logger.error(f"❌ 资源清理失败: {e}")
+            logger.error("❌ 资源清理失败: %s", e)
 
 
 # 创建FastAPI应用
@@ -142,6 +180,7 @@ app = FastAPI(
     version=settings.app_version,
     description="🚀 企业级实时聊天系统 - 支持JWT认证、OAuth2登录、私聊群聊、消息状态管理",
     lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     docs_url="/docs" if is_development() else None,
     redoc_url="/redoc" if is_development() else None,
 )
@@ -177,76 +216,112 @@ async def websocket_endpoint(websocket: WebSocket):
     """
     统一WebSocket端点 - 支持认证和消息路由
     """
-    logger.info("WebSocket连接尝试开始")
-
-    # 接受WebSocket连接
-    await websocket.accept()
-    logger.info("WebSocket连接已接受")
+    logger.debug("WebSocket连接尝试开始")
 
     # 从查询参数中提取token
     token = websocket.query_params.get("token")
-    logger.info(f"提取到token: {token is not None}")
+    logger.debug("提取到token: %s", token is not None)
 
     if not token:
         logger.warning("WebSocket连接缺少token")
         await websocket.close(code=4001, reason="缺少认证token")
         return
 
-    # 认证用户
-    try:
-        from src.chatSphere.core.auth import auth_manager
-        from src.chatSphere.core.database import get_db
+    # 握手前先离线校验签名和过期时间，无效连接不占用握手和数据库资源
+    # （命中验证缓存时跳过签名校验）
+    payload = get_cached_payload(token)
+    auth_cached = payload is not None
+    if not auth_cached:
+        try:
+            payload = auth_manager.decode_token(token)
+        except HTTPException as e:
+            logger.warning("WebSocket token校验失败: %s", e.detail)
+            await websocket.close(code=4001, reason="无效token")
+            return
 
-        # 创建数据库会话
-        async for session in get_db():
-            payload = await auth_manager.verify_token(token)
-            user_id = payload.get("sub")
+    # 接受WebSocket连接
+    await websocket.accept()
+    logger.debug("WebSocket连接已接受")
 
-            if not user_id:
-                logger.warning("Token中缺少用户ID")
-                await websocket.close(code=4001, reason="无效token")
-                return
+    # 认证用户（只在认证和建立连接期间占用数据库连接）
+    try:
+        async with db_manager.get_session() as session:
+            user = await auth_manager.get_cached_user(session, token) if auth_cached else None
 
-            user = await auth_manager.get_user_by_id(session, user_id)
             if not user:
-                logger.warning(f"用户不存在: {user_id}")
-                await websocket.close(code=4001, reason="用户不存在")
-                return
+                user_id = payload.get("sub")
+
+                if not user_id:
+                    logger.warning("Token中缺少用户ID")
+                    await websocket.close(code=4001, reason="无效token")
+                    return
 
-            logger.info(f"用户认证成功: {user.username}")
+                user = await auth_manager.get_token_user(session, payload)
+                if not user:
+                    logger.warning("用户不存在: %s", user_id)
+                    await websocket.close(code=4001, reason="用户不存在")
+                    return
+
+                cache_auth(token, payload, user)
+
+            logger.info("用户认证成功: %s", user.username)
 
             # 建立连接
             await connection_manager.connect(websocket, user, session)
 
-            try:
-                while True:
-                    # 接收消息
-                    data = await websocket.receive_text()
-                    await connection_manager.handle_message(user.id, data, session)
-
-            except WebSocketDisconnect:
-                logger.info(f"用户 {user.username} 断开连接")
-            except Exception as e:
-                logger.error(f"WebSocket错误 {user.username}: {e}")
-            finally:
-                await connection_manager.disconnect(user.id, session)
-            break
-
     except Exception as e:
-        logger.error(f"WebSocket认证失败: {e}")
+        logger.error("WebSocket认证失败: %s", e)
         await websocket.close(code=4001, reason="认证失败")
         return
 
+    # 消息循环：每条消息使用独立的短会话，避免长连接一直占用连接池
+    try:
+        while True:
+            # 接收消息（兼容文本帧和二进制帧，直接用 orjson 解析原始数据）
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+
+            raw = message.get("bytes") or message.get("text")
+            try:
+                message_data = orjson.loads(raw)
+            except orjson.JSONDecodeError:
+                await connection_manager.send_to_user(
+                    user.id, {"type": "error", "data": {"message": "无效的JSON格式"}}
+                )
+                continue
+
+            async with db_manager.get_session() as session:
+                await connection_manager.handle_message(user.id, message_data, session)
+
+    except WebSocketDisconnect:
+        logger.info("用户 %s 断开连接", user.username)
+    except Exception as e:
+        logger.error("WebSocket错误 %s: %s", user.username, e)
+    finally:
+        async with db_manager.get_session() as session:
+            await connection_manager.disconnect(user.id, session, websocket)
+
 
 # ==================== REST API路由 ====================
 
 
+# 健康检查结果缓存（探针频繁访问时避免每次都 ping 数据库和 Redis）
+HEALTH_CACHE_TTL = 1.0
+_health_cache = {"ts": 0.0, "body": b""}
+
+
 # 健康检查
 @app.get("/health")
-async def health_check():
-    """系统健康检查"""
-    db_health = await check_database_health()
-    redis_health = await check_redis_health()
+async def health_check(detailed: bool = False):
+    """系统健康检查（detailed=true 时附带 Redis INFO 信息，不走缓存）"""
+    now = time.monotonic()
+    if not detailed and now - _health_cache["ts"] < HEALTH_CACHE_TTL:
+        return Response(content=_health_cache["body"], media_type="application/json")
+
+    db_health, redis_health = await asyncio.gather(
+        check_database_health(), check_redis_health(detailed)
+    )
 
     overall_status = (
         "healthy"
@@ -254,36 +329,47 @@ async def health_check():
         else "unhealthy"
     )
 
-    return {
-        "status": overall_status,
-        "timestamp": datetime.utcnow().isoformat(),
-        "version": settings.app_version,
-        "services": {
-            "database": db_health,
-            "redis": redis_health,
-            "websocket": {
-                "status": "healthy",
-                "active_connections": len(connection_manager.active_connections),
+    body = orjson.dumps(
+        {
+            "status": overall_status,
+            "timestamp": now_iso(),
+            "version": settings.app_version,
+            "services": {
+                "database": db_health,
+                "redis": redis_health,
+                "websocket": {
+                    "status": "healthy",
+                    "active_connections": connection_manager.connection_count,
+                },
             },
-        },
-    }
+        }
+    )
+    if not detailed:
+        _health_cache["ts"] = now
+        _health_cache["body"] = body
+
+    return Response(content=body, media_type="application/json")
+
+
+# 根路径返回内容在运行期间不变，启动时计算一次
+ROOT_INFO = {
+    "message": f"欢迎使用 {settings.app_name}",
+    "version": settings.app_version,
+    "docs": "/docs",
+    "health": "/health",
+    "websocket": "/ws?token=YOUR_JWT_TOKEN",
+}
 
 
 @app.get("/")
 async def root():
     """API根路径"""
-    return {
-        "message": f"欢迎使用 {settings.app_name}",
-        "version": settings.app_version,
-        "docs": "/docs",
-        "health": "/health",
-        "websocket": "/ws?token=YOUR_JWT_TOKEN",
-    }
+    return ROOT_INFO
 
 
 # 用户相关路由
 @app.get("/api/v1/me")
-async def get_current_user_info(current_user: User = Depends(get_current_active_user)):
+async def get_current_user_info(current_user: CurrentUser):
     """获取当前用户信息"""
     user_data = {
         "id": current_user.id,
@@ -292,60 +378,88 @@ async def get_current_user_info(current_user: User = Depends(get_current_active_
         "display_name": current_user.display_name,
         "avatar_url": current_user.avatar_url,
         "oauth_provider": current_user.oauth_provider.value,
-        "created_at": current_user.created_at.isoformat(),
-        "last_seen": current_user.last_seen.isoformat() if current_user.last_seen else None,
+        "created_at": current_user.created_at,
+        "last_seen": current_user.last_seen,
     }
 
-    return {"success": True, "data": user_data, "message": "获取用户信息成功"}
+    # 直接返回 ORJSONResponse，跳过 jsonable_encoder
+    return ORJSONResponse(
+        content={"success": True, "data": user_data, "message": "获取用户信息成功"}
+    )
 
 
 @app.get("/api/v1/users/online")
-async def get_online_users(current_user: User = Depends(get_current_active_user)):
-    """获取在线用户列表"""
-    online_users = await connection_manager.get_online_users()
-    return {"count": len(online_users), "users": online_users}
+async def get_online_users(
+    current_user: CurrentUser,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+):
+    """获取在线用户列表（分页，传入上一页返回的 next_cursor 继续获取）"""
+    offset = int(cursor) if cursor and cursor.isdigit() else 0
+    limit = max(1, min(limit, 500))
+
+    online_users, total = await connection_manager.get_online_users_page(limit, offset)
+    next_offset = offset + limit
+    next_cursor = str(next_offset) if next_offset < total else None
+
+    return {"count": total, "users": online_users, "next_cursor": next_cursor}
 
 
 # 房间相关路由
+# 公共房间列表对所有用户相同，在进程内短暂缓存
+ROOMS_CACHE_TTL = 5
+_rooms_cache = TTLCache(maxsize=1, ttl=ROOMS_CACHE_TTL)
+# 需要登录才能访问，只允许浏览器缓存，不允许共享代理缓存
+ROOMS_CACHE_HEADERS = {"Cache-Control": f"private, max-age={ROOMS_CACHE_TTL}"}
+
+
 @app.get("/api/v1/rooms")
-async def get_public_rooms(
-    current_user: User = Depends(get_current_active_user), session: AsyncSession = Depends(get_db)
-):
+async def get_public_rooms(current_user: CurrentUser, session: DbSession):
     """获取公共房间列表"""
-    from sqlalchemy import select
-
-    stmt = select(Room).where(Room.is_public == True).limit(20)
+    cached = _rooms_cache.get("rooms")
+    if cached is not None:
+        return ORJSONResponse(content=cached, headers=ROOMS_CACHE_HEADERS)
+
+    # 只查询需要返回的列，不构造ORM实例
+    stmt = (
+        select(Room.id, Room.name, Room.description, Room.max_members, Room.created_at)
+        .where(Room.is_public == True)
+        .limit(20)
+    )
     result = await session.execute(stmt)
-    rooms = result.scalars().all()
-
-    room_list = []
-    for room in rooms:
-        # 获取房间在线用户数
-        online_count = len(await cache_manager.get_room_users(room.id))
-
-        room_list.append(
-            {
-                "id": room.id,
-                "name": room.name,
-                "description": room.description,
-                "max_members": room.max_members,
-                "online_count": online_count,
-                "created_at": room.created_at.isoformat(),
-            }
-        )
+    rooms = result.all()
+
+    # 一次管道请求获取所有房间的在线用户数
+    online_counts = await cache_manager.get_room_user_counts([room.id for room in rooms])
 
-    return {"rooms": room_list}
+    room_list = [
+        {
+            "id": room.id,
+            "name": room.name,
+            "description": room.description,
+            "max_members": room.max_members,
+            "online_count": online_counts.get(room.id, 0),
+            "created_at": room.created_at,
+        }
+        for room in rooms
+    ]
+
+    body = {"rooms": room_list}
+    _rooms_cache["rooms"] = body
+    return ORJSONResponse(content=body, headers=ROOMS_CACHE_HEADERS)
 
 
 # 获取特定房间的在线人数
 @app.get("/api/v1/rooms/{room_id}/online-count")
 async def get_room_online_count(
-    room_id: str, current_user: User = Depends(get_current_active_user)
+    room_id: str,
+    current_user: CurrentUser,
+    include_users: bool = False,
 ):
-    """获取特定房间的当前在线人数"""
+    """获取特定房间的当前在线人数（include_users=true 时同时返回在线用户列表）"""
     try:
-        online_users = await cache_manager.get_room_users(room_id)
-        online_count = len(online_users)
+        online_count = await cache_manager.get_room_user_count(room_id)
+        online_users = await cache_manager.get_room_users(room_id) if include_users else None
 
         return {"room_id": room_id, "online_count": online_count, "online_users": online_users}
     except Exception as e:
@@ -353,90 +467,110 @@ async def get_room_online_count(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="获取房间在线人数失败")
 
 
+# 聊天类型路径参数，由FastAPI在进入处理函数前校验
+ChatTypeParam = Literal["private", "group", "room"]
+
+# 消息历史接口返回的列
+MESSAGE_HISTORY_COLUMNS = (
+    Message.id,
+    Message.from_user_id,
+    Message.content,
+    Message.message_type,
+    Message.created_at,
+    Message.is_edited,
+    Message.reply_to_id,
+    # 发送者信息随消息一起返回，前端无需再逐个查询用户
+    User.username.label("from_username"),
+    User.display_name.label("from_display_name"),
+    User.avatar_url.label("from_avatar_url"),
+)
+
+
 # 消息相关路由
 @app.get("/api/v1/messages/{chat_type}/{chat_id}")
 async def get_chat_messages(
-    chat_type: str,
+    chat_type: ChatTypeParam,
     chat_id: str,
+    current_user: CurrentUser,
+    session: DbSession,
     limit: int = 50,
-    offset: int = 0,
-    current_user: User = Depends(get_current_active_user),
-    session: AsyncSession = Depends(get_db),
+    before_ts: Optional[datetime] = None,
+    before_id: Optional[int] = None,
 ):
-    """获取聊天消息历史"""
-    from sqlalchemy import desc, select
-
-    # 验证聊天类型
-    if chat_type not in ["private", "group", "room"]:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的聊天类型")
+    """获取聊天消息历史（基于游标的分页，传入上一页返回的 next_cursor 继续向前翻）"""
+
+    def page(stmt):
+        """追加游标条件和排序，避免 OFFSET 扫描丢弃的行"""
+        if before_ts is not None:
+            if before_id is not None:
+                stmt = stmt.where(
+                    or_(
+                        Message.created_at < before_ts,
+                        and_(Message.created_at == before_ts, Message.id < before_id),
+                    )
+                )
+            else:
+                stmt = stmt.where(Message.created_at < before_ts)
+        return stmt.order_by(desc(Message.created_at), desc(Message.id)).limit(limit)
+
+    def history_select(*conditions):
+        """查询消息历史需要返回的列，并按主键关联发送者"""
+        return (
+            select(*MESSAGE_HISTORY_COLUMNS)
+            .join(User, User.id == Message.from_user_id)
+            .where(*conditions)
+        )
 
-    # 构建查询
+    # 构建查询（只查询需要返回的列）
     if chat_type == "private":
-        stmt = (
-            select(Message)
-            .where(
-                ((Message.from_user_id == current_user.id) & (Message.to_user_id == chat_id))
-                | ((Message.from_user_id == chat_id) & (Message.to_user_id == current_user.id))
-            )
-            .order_by(desc(Message.created_at))
-            .limit(limit)
-            .offset(offset)
+        # 拆成两个方向分别走 (from_user_id, to_user_id, created_at) 索引，再合并排序
+        sent_stmt = page(
+            history_select(Message.from_user_id == current_user.id, Message.to_user_id == chat_id)
         )
-    elif chat_type == "group":
-        stmt = (
-            select(Message)
-            .where(Message.group_id == chat_id)
-            .order_by(desc(Message.created_at))
-            .limit(limit)
-            .offset(offset)
+        received_stmt = page(
+            history_select(Message.from_user_id == chat_id, Message.to_user_id == current_user.id)
         )
-    else:  # room
+        private_messages = union_all(sent_stmt, received_stmt).subquery()
         stmt = (
-            select(Message)
-            .where(Message.room_id == chat_id)
-            .order_by(desc(Message.created_at))
+            select(private_messages)
+            .order_by(desc(private_messages.c.created_at), desc(private_messages.c.id))
             .limit(limit)
-            .offset(offset)
         )
+    elif chat_type == "group":
+        stmt = page(history_select(Message.group_id == chat_id))
+    else:  # room
+        stmt = page(history_select(Message.room_id == chat_id))
 
     result = await session.execute(stmt)
-    messages = result.scalars().all()
+    messages = result.all()
 
     # 格式化消息
-    message_list = []
-    for msg in messages:
-        message_list.append(
-            {
-                "id": msg.id,
-                "from_user_id": msg.from_user_id,
-                "content": msg.content,
-                "message_type": msg.message_type.value,
-                "created_at": msg.created_at.isoformat(),
-                "is_edited": msg.is_edited,
-                "reply_to_id": msg.reply_to_id,
-            }
-        )
+    message_list = [dict(msg._mapping) for msg in messages]
 
     # 反转顺序（最新的在底部）
     message_list.reverse()
 
-    return {
-        "messages": message_list,
-        "total": len(message_list),
-        "has_more": len(messages) == limit,
-    }
+    has_more = len(messages) == limit
+    next_cursor = (
+        {"before_ts": messages[-1].created_at, "before_id": messages[-1].id} if has_more else None
+    )
+
+    return ORJSONResponse(
+        content={
+            "messages": message_list,
+            "total": len(message_list),
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+        }
+    )
 
 
 @app.get("/api/v1/conversations")
-async def get_user_conversations(
-    current_user: User = Depends(get_current_active_user), session: AsyncSession = Depends(get_db)
-):
+async def get_user_conversations(current_user: CurrentUser, session: DbSession):
     """获取用户会话列表"""
-    from src.chatSphere.services.conversation_service import get_user_conversations_with_details
-
     try:
         conversations = await get_user_conversations_with_details(session, current_user.id)
-        return {"conversations": conversations}
+        return ORJSONResponse(content={"conversations": conversations})
     except Exception as e:
         logger.error(f"获取会话列表失败: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="获取会话列表失败")
@@ -444,57 +578,74 @@ async def get_user_conversations(
 
 # 统计信息
 @app.get("/api/v1/stats")
-async def get_system_stats(
-    current_user: User = Depends(get_current_active_user), session: AsyncSession = Depends(get_db)
-):
+async def get_system_stats(current_user: CurrentUser, session: DbSession):
     """获取系统统计信息"""
-    from sqlalchemy import func, select
-
     # 在线用户数
-    online_users_count = len(connection_manager.active_connections)
+    online_users_count = connection_manager.connection_count
+
+    # 优先读取Redis中维护的计数器
+    today_start = _utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    today = today_start.date().isoformat()
+    total_users, total_messages, today_messages = await cache_manager.get_stats_counters(today)
+
+    if None in (total_users, total_messages, today_messages):
+        # 计数器缺失（如Redis重启），回退到数据库统计并重新初始化计数器
+        total_users, today_messages, total_messages = await count_system_stats(session, today_start)
+        await cache_manager.init_stats_counters(total_users, total_messages, today, today_messages)
+
+    return ORJSONResponse(
+        content={
+            "online_users": online_users_count,
+            "total_users": total_users,
+            "today_messages": today_messages,
+            "total_messages": total_messages,
+            "server_time": now_iso(),
+        }
+    )
+
 
-    # 总用户数
-    total_users_stmt = select(func.count(User.id))
-    total_users_result = await session.execute(total_users_stmt)
-    total_users = total_users_result.scalar()
+async def count_system_stats(session: AsyncSession, today_start: datetime):
+    """从数据库统计总用户数、今日消息数、总消息数"""
+    # 今日时间范围（范围条件可以走 created_at 索引，func.date() 不行）
+    tomorrow_start = today_start + timedelta(days=1)
 
-    # 今日消息数
-    today = datetime.utcnow().date()
-    today_messages_stmt = select(func.count(Message.id)).where(
-        func.date(Message.created_at) == today
+    # 三个统计合并为一次查询
+    stmt = select(
+        select(func.count(User.id)).scalar_subquery().label("total_users"),
+        select(func.count(Message.id))
+        .where(Message.created_at >= today_start, Message.created_at < tomorrow_start)
+        .scalar_subquery()
+        .label("today_messages"),
+        select(func.count(Message.id)).scalar_subquery().label("total_messages"),
     )
-    today_messages_result = await session.execute(today_messages_stmt)
-    today_messages = today_messages_result.scalar()
-
-    # 总消息数
-    total_messages_stmt = select(func.count(Message.id))
-    total_messages_result = await session.execute(total_messages_stmt)
-    total_messages = total_messages_result.scalar()
-
-    return {
-        "online_users": online_users_count,
-        "total_users": total_users,
-        "today_messages": today_messages,
-        "total_messages": total_messages,
-        "server_time": datetime.utcnow().isoformat(),
-    }
+    result = await session.execute(stmt)
+    return result.one()
+
+
+async def init_stats_counters():
+    """启动时用数据库中的数量初始化统计计数器"""
+    today_start = _utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    try:
+        async with db_manager.get_session() as session:
+            total_users, today_messages, total_messages = await count_system_stats(
+                session, today_start
+            )
+        await cache_manager.init_stats_counters(
+            total_users, total_messages, today_start.date().isoformat(), today_messages
+        )
+    except Exception as e:
+        logger.error("初始化统计计数器失败: %s", e)
 
 
 # 标记消息为已读
 @app.post("/api/v1/conversations/{chat_type}/{chat_id}/mark-read")
 async def mark_conversation_as_read_api(
-    chat_type: str,
+    chat_type: ChatTypeParam,
     chat_id: str,
-    current_user: User = Depends(get_current_active_user),
-    session: AsyncSession = Depends(get_db),
+    current_user: CurrentUser,
+    session: DbSession,
 ):
     """标记会话为已读"""
-    from src.chatSphere.services.conversation_service import mark_conversation_as_read
-
-    # 验证聊天类型
-    if chat_type not in ["private", "group", "room"]:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="无效的聊天类型")
-
     try:
         success = await mark_conversation_as_read(session, current_user.id, chat_type, chat_id)
 
@@ -505,25 +656,39 @@ async def mark_conversation_as_read_api(
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="标记会话已读失败")
 
 
-# 包含认证路由
-from src.chatSphere.api.routes.auth import router as auth_router
-
-app.include_router(auth_router, prefix="/api/v1/auth", tags=["认证"])
-
-
 # 错误处理器
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return JSONResponse(
-        status_code=exc.status_code,
-        content=ApiResponse.error(message=str(exc.detail), code=ResponseCode.INTERNAL_ERROR).dict(),
+    # 已知的业务错误使用对应的错误码和状态码，其他保持原状态码
+    # detail 也可以是 dict/list，只有字符串才能作为键查找
+    code = HTTP_EXCEPTION_CODES.get(exc.detail) if isinstance(exc.detail, str) else None
+    if code is None:
+        code = ResponseCode.INTERNAL_ERROR
+        status_code = exc.status_code
+    else:
+        # 映射缺失时保留原状态码，不能把业务错误变成500
+        status_code = HTTP_STATUS_MAP.get(code, exc.status_code)
+
+    return ORJSONResponse(
+        status_code=status_code,
+        content=ApiResponse.error(message=str(exc.detail), code=code).dict(),
+        headers=exc.headers,
     )
 
 
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request, exc):
-    response = format_validation_errors(exc.errors())
-    return JSONResponse(
+    errors = exc.errors()
+
+    # 密码强度、用户名格式等字段错误返回对应的业务错误码
+    field_error = format_field_error(errors)
+    if field_error:
+        return ORJSONResponse(
+            status_code=HTTP_STATUS_MAP[ResponseCode(field_error.code)], content=field_error.dict()
+        )
+
+    response = format_validation_errors(errors)
+    return ORJSONResponse(
         status_code=HTTP_STATUS_MAP[ResponseCode.VALIDATION_ERROR], content=response.dict()
     )
 
@@ -531,11 +696,23 @@ async def validation_exception_handler(request, exc):
 if __name__ == "__main__":
     import uvicorn
 
+    # uvloop 不支持 Windows，开发环境下回退到标准 asyncio 事件循环
+    try:
+        import uvloop  # noqa: F401
+
+        event_loop = "uvloop"
+    except ImportError:
+        event_loop = "asyncio"
+
     uvicorn.run(
         "main:app",
         host=settings.host,
         port=settings.port,
         reload=settings.reload,
+        loop=event_loop,
+        http="httptools",
+        ws="websockets",
         log_level=settings.log_level.lower(),
-        access_log=True,
+        log_config=None,  # 日志已由 setup_logging 配置，不让 uvicorn 再覆盖一遍
+        access_log=is_development(),  # 生产环境关闭访问日志，避免每个请求同步写日志
     )
@@ -1,19 +1,29 @@
 """
 认证相关路由
 """
+import asyncio
+import hashlib
+import operator
 from datetime import datetime
 from typing import Optional
 
-from fastapi import APIRouter, Depends, Form, HTTPException, status
-from fastapi.responses import JSONResponse
-from fastapi.security import OAuth2PasswordRequestForm
-from pydantic import BaseModel, EmailStr
-from sqlalchemy.ext.asyncio import AsyncSession
+import orjson
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, Response, status
+from fastapi.responses import ORJSONResponse
+from pydantic import BaseModel, EmailStr, Field
+from sqlalchemy import update
 
-from src.chatSphere.core.auth import auth_manager, get_current_active_user, oauth_manager
+from src.chatSphere.core.auth import CurrentUser, auth_manager, oauth_manager
+from src.chatSphere.core.auth_cache import invalidate_user
 from src.chatSphere.core.cache import cache_manager
-from src.chatSphere.core.database import get_db, transactional
+from src.chatSphere.core.database import DbSession, transactional
 from src.chatSphere.core.models import OAuthProvider, User
+from src.chatSphere.core.rate_limit import (
+    LOGIN_RATE_LIMIT,
+    LOGIN_RATE_WINDOW,
+    client_ip,
+    login_bucket,
+)
 from src.chatSphere.services.responses import (
     HTTP_STATUS_MAP,
     ApiResponse,
@@ -23,15 +33,71 @@ from src.chatSphere.services.responses import (
 
 router = APIRouter()
 
+# 本模块用到的HTTP状态码，导入时计算一次
+_HTTP_OK = HTTP_STATUS_MAP[ResponseCode.SUCCESS]
+_HTTP_CREATED = HTTP_STATUS_MAP[ResponseCode.CREATED]
+_CODE_SUCCESS = ResponseCode.SUCCESS.value
+
+# 支持的OAuth2提供商
+_OAUTH_PROVIDERS = {"google": OAuthProvider.GOOGLE, "github": OAuthProvider.GITHUB}
+
+# 内容固定的错误响应，导入时序列化一次
+_STATIC_ERRORS = {
+    code: (
+        HTTP_STATUS_MAP[code],
+        orjson.dumps(ApiResponse.error(message=message, code=code).dict()),
+    )
+    for code, message in (
+        (ResponseCode.TOO_MANY_REQUESTS, "登录尝试过于频繁，请稍后再试"),
+        (ResponseCode.INVALID_CREDENTIALS, ResponseMessage.INVALID_CREDENTIALS),
+    )
+}
+
+
+_USER_KEYS = (
+    "id",
+    "email",
+    "username",
+    "display_name",
+    "avatar_url",
+    "oauth_provider",
+    "created_at",
+    "last_seen",
+)
+_get_user_fields = operator.attrgetter(*_USER_KEYS)
+
+# /me 响应允许浏览器短暂缓存
+_ME_CACHE_HEADERS = {"Cache-Control": "private, max-age=10"}
+
+
+def _user_etag(user: User) -> str:
+    """根据用户ID和资料变更时间生成ETag"""
+    version = f"{user.id}:{user.updated_at}:{user.last_seen}"
+    return f'"{hashlib.blake2b(version.encode(), digest_size=8).hexdigest()}"'
+
+
+def _serialize_user(user: User) -> dict:
+    """构建返回给客户端的用户信息（datetime 交给 orjson 序列化）"""
+    data = dict(zip(_USER_KEYS, _get_user_fields(user)))
+    data["oauth_provider"] = data["oauth_provider"].value
+    return data
+
+
+def _static_error(code: ResponseCode) -> Response:
+    """返回预先序列化的错误响应"""
+    status_code, body = _STATIC_ERRORS[code]
+    return Response(content=body, status_code=status_code, media_type="application/json")
+
 
 # ==================== Pydantic模型 ====================
 
 
 class UserRegister(BaseModel):
     email: EmailStr
-    username: str
+    # 至少3位，只能包含字母和数字（与 str.isalnum 一致，允许中文）
+    username: str = Field(min_length=3, pattern=r"^[\p{L}\p{N}]+$")
     display_name: str
-    password: str
+    password: str = Field(min_length=6)
 
 
 class UserLogin(BaseModel):
@@ -48,6 +114,21 @@ class RefreshTokenRequest(BaseModel):
     refresh_token: str
 
 
+class RevokeTokenRequest(BaseModel):
+    token: str
+
+
+class UpdateProfileRequest(BaseModel):
+    display_name: Optional[str] = None
+    avatar_url: Optional[str] = None
+    bio: Optional[str] = None
+
+
+class ChangePasswordRequest(BaseModel):
+    current_password: str
+    new_password: str
+
+
 class UserResponse(BaseModel):
     id: str
     email: str
@@ -79,380 +160,225 @@ class LoginResponse(BaseModel):
 
 @router.post("/register", response_model=ApiResponse)
 @transactional
-async def register_user(user_data: UserRegister, session: AsyncSession = Depends(get_db)):
+async def register_user(user_data: UserRegister, session: DbSession):
     """用户注册"""
 
-    try:
-        # 验证密码强度（简单版本）
-        if len(user_data.password) < 6:
-            return JSONResponse(
-                status_code=HTTP_STATUS_MAP[ResponseCode.WEAK_PASSWORD],
-                content=ApiResponse.error(
-                    message=ResponseMessage.WEAK_PASSWORD,
-                    code=ResponseCode.WEAK_PASSWORD,
-                    data={"field": "password", "requirement": "至少6位字符"},
-                ).dict(),
-            )
-
-        # 验证用户名格式
-        if len(user_data.username) < 3 or not user_data.username.isalnum():
-            return JSONResponse(
-                status_code=HTTP_STATUS_MAP[ResponseCode.BAD_REQUEST],
-                content=ApiResponse.error(
-                    message="用户名格式不正确",
-                    code=ResponseCode.BAD_REQUEST,
-                    data={"field": "username", "requirement": "至少3位，只能包含字母和数字"},
-                ).dict(),
-            )
-
-        # 创建用户
-        user = await auth_manager.create_user(
-            session=session,
-            email=user_data.email,
-            username=user_data.username,
-            display_name=user_data.display_name,
-            password=user_data.password,
-            oauth_provider=OAuthProvider.LOCAL,
-        )
+    # 密码强度和用户名格式由 UserRegister 在解析请求时校验
+    # 创建用户
+    user = await auth_manager.create_user(
+        session=session,
+        email=user_data.email,
+        username=user_data.username,
+        display_name=user_data.display_name,
+        password=user_data.password,
+        oauth_provider=OAuthProvider.LOCAL,
+    )
+
+    # 生成token
+    tokens = await auth_manager.generate_tokens(session, user)
+
+    # 缓存用户会话
+    await cache_manager.cache_user_session(
+        user.id,
+        {
+            "user_id": user.id,
+            "username": user.username,
+            "last_login": datetime.utcnow().isoformat(),
+        },
+    )
+
+    response_data = {
+        "user": _serialize_user(user),
+        **tokens,
+    }
 
-        # 生成token
-        tokens = await auth_manager.generate_tokens(session, user)
+    return ORJSONResponse(
+        status_code=_HTTP_CREATED,
+        content=ApiResponse.created(
+            data=response_data, message=ResponseMessage.REGISTER_SUCCESS
+        ).dict(),
+    )
 
-        # 缓存用户会话
-        await cache_manager.cache_user_session(
-            user.id,
-            {
-                "user_id": user.id,
-                "username": user.username,
-                "last_login": datetime.utcnow().isoformat(),
-            },
-        )
 
-        response_data = {
-            "user": {
-                "id": user.id,
-                "email": user.email,
-                "username": user.username,
-                "display_name": user.display_name,
-                "avatar_url": user.avatar_url,
-                "oauth_provider": user.oauth_provider.value,
-                "created_at": user.created_at.isoformat(),
-                "last_seen": user.last_seen.isoformat() if user.last_seen else None,
-            },
-            **tokens,
-        }
-
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.CREATED],
-            content=ApiResponse.created(
-                data=response_data, message=ResponseMessage.REGISTER_SUCCESS
-            ).dict(),
-        )
+@router.post("/login", response_model=ApiResponse)
+@transactional
+async def login_user(user_data: UserLogin, request: Request, session: DbSession):
+    """用户登录"""
 
-    except HTTPException as e:
-        # 处理业务逻辑异常
-        if "邮箱已被使用" in str(e.detail):
-            error_code = ResponseCode.EMAIL_ALREADY_EXISTS
-            message = ResponseMessage.EMAIL_ALREADY_EXISTS
-        elif "用户名已被使用" in str(e.detail):
-            error_code = ResponseCode.USERNAME_ALREADY_EXISTS
-            message = ResponseMessage.USERNAME_ALREADY_EXISTS
-        else:
-            error_code = ResponseCode.BAD_REQUEST
-            message = str(e.detail)
-
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[error_code],
-            content=ApiResponse.error(message=message, code=error_code).dict(),
+    # 检查速率限制：先查本地令牌桶，放行后再由Redis做跨进程计数
+    if not login_bucket.allow(f"{client_ip(request)}:{user_data.email}") or not (
+        await cache_manager.check_rate_limit(
+            user_data.email, "login", limit=LOGIN_RATE_LIMIT, window=LOGIN_RATE_WINDOW
         )
+    ):
+        return _static_error(ResponseCode.TOO_MANY_REQUESTS)
 
-    except Exception as e:
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.INTERNAL_ERROR],
-            content=ApiResponse.error(
-                message=ResponseMessage.INTERNAL_ERROR,
-                code=ResponseCode.INTERNAL_ERROR,
-                data={"detail": str(e)},
-            ).dict(),
-        )
+    # 认证用户
+    user = await auth_manager.authenticate_user(session, user_data.email, user_data.password)
 
+    if not user:
+        return _static_error(ResponseCode.INVALID_CREDENTIALS)
 
-@router.post("/login", response_model=ApiResponse)
-@transactional
-async def login_user(user_data: UserLogin, session: AsyncSession = Depends(get_db)):
-    """用户登录"""
+    # 更新最后登录时间
+    now = datetime.utcnow()
+    user.last_seen = now
 
-    try:
-        # 检查速率限制
-        if not await cache_manager.check_rate_limit(
-            user_data.email, "login", limit=5, window=300  # 5分钟内最多5次尝试
-        ):
-            return JSONResponse(
-                status_code=HTTP_STATUS_MAP[ResponseCode.TOO_MANY_REQUESTS],
-                content=ApiResponse.error(
-                    message="登录尝试过于频繁，请稍后再试", code=ResponseCode.TOO_MANY_REQUESTS
-                ).dict(),
-            )
-
-        # 认证用户
-        user = await auth_manager.authenticate_user(session, user_data.email, user_data.password)
-
-        if not user:
-            return JSONResponse(
-                status_code=HTTP_STATUS_MAP[ResponseCode.INVALID_CREDENTIALS],
-                content=ApiResponse.error(
-                    message=ResponseMessage.INVALID_CREDENTIALS,
-                    code=ResponseCode.INVALID_CREDENTIALS,
-                ).dict(),
-            )
-
-        # 更新最后登录时间
-        user.last_seen = datetime.utcnow()
-
-        # 生成token
-        tokens = await auth_manager.generate_tokens(session, user)
-
-        # 缓存用户会话
-        await cache_manager.cache_user_session(
+    # 生成token，同时缓存用户会话（单条 SET，与数据库写入并发）
+    tokens, _ = await asyncio.gather(
+        auth_manager.generate_tokens(session, user),
+        cache_manager.cache_user_session(
             user.id,
             {
                 "user_id": user.id,
                 "username": user.username,
-                "last_login": datetime.utcnow().isoformat(),
+                "last_login": now.isoformat(),
             },
-        )
+        ),
+    )
 
-        response_data = {
-            "user": {
-                "id": user.id,
-                "email": user.email,
-                "username": user.username,
-                "display_name": user.display_name,
-                "avatar_url": user.avatar_url,
-                "oauth_provider": user.oauth_provider.value,
-                "created_at": user.created_at.isoformat(),
-                "last_seen": user.last_seen.isoformat(),
-            },
-            **tokens,
-        }
-
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.SUCCESS],
-            content=ApiResponse.success(
-                data=response_data, message=ResponseMessage.LOGIN_SUCCESS
-            ).dict(),
-        )
+    response_data = {
+        "user": _serialize_user(user),
+        **tokens,
+    }
 
-    except Exception as e:
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.INTERNAL_ERROR],
-            content=ApiResponse.error(
-                message=ResponseMessage.INTERNAL_ERROR,
-                code=ResponseCode.INTERNAL_ERROR,
-                data={"detail": str(e)},
-            ).dict(),
-        )
+    return ORJSONResponse(
+        status_code=_HTTP_OK,
+        content=ApiResponse.success(
+            data=response_data, message=ResponseMessage.LOGIN_SUCCESS
+        ).dict(),
+    )
 
 
 @router.post("/oauth2/login", response_model=LoginResponse)
 @transactional
-async def oauth2_login(oauth_data: OAuth2Login, session: AsyncSession = Depends(get_db)):
+async def oauth2_login(
+    oauth_data: OAuth2Login, background_tasks: BackgroundTasks, session: DbSession
+):
     """OAuth2登录"""
 
     # 验证提供商
-    if oauth_data.provider not in ["google", "github"]:
+    provider = _OAUTH_PROVIDERS.get(oauth_data.provider)
+    if provider is None:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="不支持的OAuth2提供商")
 
-    try:
-        provider = OAuthProvider.GOOGLE if oauth_data.provider == "google" else OAuthProvider.GITHUB
-
-        # 处理OAuth登录
-        result = await oauth_manager.process_oauth_login(
-            session=session,
-            provider=provider,
-            access_token=oauth_data.access_token,
-            auth_manager=auth_manager,
-        )
-
-        # 缓存用户会话
-        await cache_manager.cache_user_session(
-            result["user"]["id"],
-            {
-                "user_id": result["user"]["id"],
-                "username": result["user"]["username"],
-                "last_login": datetime.utcnow().isoformat(),
-                "oauth_provider": oauth_data.provider,
-            },
-        )
-
-        return LoginResponse(**result)
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"OAuth2登录失败: {str(e)}"
-        )
+    # 处理OAuth登录
+    result = await oauth_manager.process_oauth_login(
+        session=session,
+        provider=provider,
+        access_token=oauth_data.access_token,
+        auth_manager=auth_manager,
+    )
+
+    # 更新最后登录时间和缓存用户会话不影响响应内容，放到响应发送后执行
+    user_id = result["user"]["id"]
+    background_tasks.add_task(auth_manager.touch_last_seen, user_id)
+    background_tasks.add_task(
+        cache_manager.cache_user_session,
+        user_id,
+        {
+            "user_id": user_id,
+            "username": result["user"]["username"],
+            "last_login": datetime.utcnow().isoformat(),
+            "oauth_provider": oauth_data.provider,
+        },
+    )
+
+    return LoginResponse(**result)
 
 
 @router.post("/token/refresh", response_model=ApiResponse)
 @transactional
-async def refresh_access_token(
-    token_data: RefreshTokenRequest, session: AsyncSession = Depends(get_db)
-):
+async def refresh_access_token(token_data: RefreshTokenRequest, session: DbSession):
     """刷新访问token"""
 
-    try:
-        tokens = await auth_manager.refresh_access_token(session, token_data.refresh_token)
+    tokens = await auth_manager.refresh_access_token(session, token_data.refresh_token)
 
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.SUCCESS],
-            content=ApiResponse.success(
-                data=tokens, message=ResponseMessage.TOKEN_REFRESHED
-            ).dict(),
-        )
-
-    except HTTPException as e:
-        if "invalid" in str(e.detail).lower():
-            error_code = ResponseCode.INVALID_TOKEN
-            message = ResponseMessage.INVALID_TOKEN
-        elif "expired" in str(e.detail).lower():
-            error_code = ResponseCode.TOKEN_EXPIRED
-            message = ResponseMessage.TOKEN_EXPIRED
-        else:
-            error_code = ResponseCode.BAD_REQUEST
-            message = str(e.detail)
-
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[error_code],
-            content=ApiResponse.error(message=message, code=error_code).dict(),
-        )
-
-    except Exception as e:
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.INTERNAL_ERROR],
-            content=ApiResponse.error(
-                message=ResponseMessage.INTERNAL_ERROR,
-                code=ResponseCode.INTERNAL_ERROR,
-                data={"detail": str(e)},
-            ).dict(),
-        )
+    return ORJSONResponse(
+        status_code=_HTTP_OK,
+        content=ApiResponse.success(data=tokens, message=ResponseMessage.TOKEN_REFRESHED).dict(),
+    )
 
 
 @router.post("/logout", response_model=ApiResponse)
-@transactional
-async def logout_user(
-    current_user: User = Depends(get_current_active_user), session: AsyncSession = Depends(get_db)
-):
+async def logout_user(current_user: CurrentUser):
     """用户登出"""
 
-    try:
-        # 清理用户会话缓存
-        await cache_manager.clear_user_session(current_user.id)
+    # 清理用户会话缓存
+    await cache_manager.delete_user_session(current_user.id)
+    invalidate_user(current_user.id)
 
-        # 这里可以添加其他登出逻辑，比如将token加入黑名单
+    # 这里可以添加其他登出逻辑，比如将token加入黑名单
 
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.SUCCESS],
-            content=ApiResponse.success(message=ResponseMessage.LOGOUT_SUCCESS).dict(),
-        )
-
-    except Exception as e:
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.INTERNAL_ERROR],
-            content=ApiResponse.error(
-                message=ResponseMessage.INTERNAL_ERROR,
-                code=ResponseCode.INTERNAL_ERROR,
-                data={"detail": str(e)},
-            ).dict(),
-        )
+    return ORJSONResponse(
+        status_code=_HTTP_OK,
+        content=ApiResponse.success(message=ResponseMessage.LOGOUT_SUCCESS).dict(),
+    )
 
 
 @router.post("/revoke-token")
-async def revoke_token(
-    token: str = Form(...), current_user: User = Depends(get_current_active_user)
-):
+async def revoke_token(token_data: RevokeTokenRequest, current_user: CurrentUser):
     """撤销token"""
 
-    try:
-        await auth_manager.revoke_token(token)
-        return {"message": "Token已撤销"}
+    await auth_manager.revoke_token(token_data.token)
+    return {"message": "Token已撤销"}
 
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"Token撤销失败: {str(e)}"
-        )
+
+@router.post("/revoke-all")
+@transactional
+async def revoke_all_tokens(current_user: CurrentUser, session: DbSession):
+    """撤销当前用户在所有设备上的登录"""
+
+    await auth_manager.revoke_all_tokens(session, current_user.id)
+    await cache_manager.delete_user_session(current_user.id)
+    return {"message": "已撤销所有Token"}
 
 
 @router.get("/me", response_model=ApiResponse)
-async def get_current_user_profile(current_user: User = Depends(get_current_active_user)):
+async def get_current_user_profile(request: Request, current_user: CurrentUser):
     """获取当前用户资料"""
 
-    try:
-        user_data = {
-            "id": current_user.id,
-            "email": current_user.email,
-            "username": current_user.username,
-            "display_name": current_user.display_name,
-            "avatar_url": current_user.avatar_url,
-            "oauth_provider": current_user.oauth_provider.value,
-            "created_at": current_user.created_at.isoformat(),
-            "last_seen": current_user.last_seen.isoformat() if current_user.last_seen else None,
-        }
-
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.SUCCESS],
-            content=ApiResponse.success(data=user_data, message="获取用户信息成功").dict(),
-        )
+    # 资料未变化时返回304，不再构建响应体
+    etag = _user_etag(current_user)
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag, **_ME_CACHE_HEADERS})
 
-    except Exception as e:
-        return JSONResponse(
-            status_code=HTTP_STATUS_MAP[ResponseCode.INTERNAL_ERROR],
-            content=ApiResponse.error(
-                message=ResponseMessage.INTERNAL_ERROR,
-                code=ResponseCode.INTERNAL_ERROR,
-                data={"detail": str(e)},
-            ).dict(),
-        )
+    # 直接构建响应信封，跳过 ApiResponse 模型校验
+    return ORJSONResponse(
+        status_code=_HTTP_OK,
+        content={
+            "code": _CODE_SUCCESS,
+            "message": "获取用户信息成功",
+            "data": _serialize_user(current_user),
+        },
+        headers={"ETag": etag, **_ME_CACHE_HEADERS},
+    )
 
 
 @router.put("/me")
 @transactional
 async def update_user_profile(
-    display_name: Optional[str] = Form(None),
-    avatar_url: Optional[str] = Form(None),
-    bio: Optional[str] = Form(None),
-    current_user: User = Depends(get_current_active_user),
-    session: AsyncSession = Depends(get_db),
+    profile_data: UpdateProfileRequest,
+    current_user: CurrentUser,
+    session: DbSession,
 ):
     """更新用户资料"""
 
-    try:
-        # 更新字段
-        if display_name is not None:
-            current_user.display_name = display_name
-        if avatar_url is not None:
-            current_user.avatar_url = avatar_url
-        if bio is not None:
-            current_user.bio = bio
+    # 只更新传入的字段，按主键直接 UPDATE
+    values = profile_data.dict(exclude_none=True)
+    if values:
+        values["updated_at"] = datetime.utcnow()
+        await session.execute(update(User).where(User.id == current_user.id).values(**values))
+        invalidate_user(current_user.id)
 
-        current_user.updated_at = datetime.utcnow()
-
-        return {"message": "资料更新成功"}
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"资料更新失败: {str(e)}"
-        )
+    return {"message": "资料更新成功"}
 
 
 @router.post("/change-password")
 @transactional
 async def change_password(
-    current_password: str = Form(...),
-    new_password: str = Form(...),
-    current_user: User = Depends(get_current_active_user),
-    session: AsyncSession = Depends(get_db),
+    password_data: ChangePasswordRequest,
+    current_user: CurrentUser,
+    session: DbSession,
 ):
     """修改密码"""
 
@@ -460,33 +386,30 @@ async def change_password(
     if not current_user.hashed_password:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="OAuth用户无法修改密码")
 
-    if not auth_manager.verify_password(current_password, current_user.hashed_password):
+    if not await auth_manager.verify_password(
+        password_data.current_password, current_user.hashed_password
+    ):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="当前密码错误")
 
     # 验证新密码
-    if len(new_password) < 6:
+    if len(password_data.new_password) < 6:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="新密码长度至少6位")
 
-    try:
-        # 更新密码
-        current_user.hashed_password = auth_manager.get_password_hash(new_password)
-        current_user.updated_at = datetime.utcnow()
+    # 更新密码
+    current_user.hashed_password = await auth_manager.get_password_hash(password_data.new_password)
+    current_user.updated_at = datetime.utcnow()
+    invalidate_user(current_user.id)
 
-        return {"message": "密码修改成功"}
-
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail=f"密码修改失败: {str(e)}"
-        )
+    return {"message": "密码修改成功"}
 
 
 @router.get("/validate-token")
-async def validate_token(current_user: User = Depends(get_current_active_user)):
+async def validate_token(current_user: CurrentUser):
     """验证token有效性"""
 
     return {
         "valid": True,
         "user_id": current_user.id,
         "username": current_user.username,
-        "timestamp": datetime.utcnow().isoformat(),
+        "timestamp": datetime.utcnow(),
     }
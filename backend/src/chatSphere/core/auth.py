@@ -1,30 +1,62 @@
 """
 JWT认证和OAuth2系统
 """
+import asyncio
 import logging
+import os
 import secrets
+import time
 import uuid
-from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from concurrent.futures import ProcessPoolExecutor
+from typing import Annotated, Any, Dict, Optional
 
 import httpx
+import jwt
+import orjson
 from authlib.integrations.httpx_client import AsyncOAuth2Client
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
-from jose import jwt
 from passlib.context import CryptContext
-from sqlalchemy import select
+from sqlalchemy import func, or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from .auth_cache import (
+    cache_auth,
+    get_cached_payload,
+    invalidate_token,
+    invalidate_user,
+    load_cached_user,
+)
 from .cache import cache_manager
 from .config import settings
-from .database import get_db
-from .models import OAuthProvider, RefreshToken, User, UserStatus
+from .database import DbSession, after_commit, db_manager
+from .models import OAuthProvider, User, UserStatus
 
 logger = logging.getLogger(__name__)
 
-# 密码加密上下文
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# 密码加密上下文：新密码使用 argon2id，旧的 bcrypt 哈希在登录成功后自动升级
+pwd_context = CryptContext(
+    schemes=["argon2", "bcrypt"],
+    deprecated="auto",
+    argon2__type="ID",
+)
+
+
+def _verify_password(plain_password: str, hashed_password: str) -> bool:
+    """在进程池中执行的密码校验"""
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def _hash_password(password: str) -> str:
+    """在进程池中执行的密码哈希"""
+    return pwd_context.hash(password)
+
+
+def _warm_up_hasher():
+    """在工作进程中加载所有哈希后端（passlib 在首次调用时才探测后端）"""
+    for scheme in pwd_context.schemes():
+        pwd_context.handler(scheme).get_backend()
+
 
 # JWT Bearer
 security = HTTPBearer()
@@ -34,81 +66,127 @@ class AuthManager:
     """认证管理器"""
 
     def __init__(self):
-        self.secret_key = settings.secret_key
+        # 预先编码为bytes，避免每次签名/验签时转换
+        self.secret_key = settings.secret_key.encode()
         self.algorithm = settings.algorithm
         self.access_token_expire_minutes = settings.access_token_expire_minutes
         self.refresh_token_expire_days = settings.refresh_token_expire_days
+        self.hash_workers = settings.password_hash_workers or os.cpu_count()
+        self._hash_pool: Optional[ProcessPoolExecutor] = None
+
+    # 密码相关（bcrypt 是CPU密集操作，放到进程池中执行，避免阻塞事件循环）
+    def _get_hash_pool(self) -> ProcessPoolExecutor:
+        """获取密码哈希进程池（首次使用时创建）"""
+        if self._hash_pool is None:
+            self._hash_pool = ProcessPoolExecutor(max_workers=self.hash_workers)
+        return self._hash_pool
+
+    async def warm_hash_pool(self):
+        """启动所有哈希工作进程并加载哈希后端，避免首次登录时的冷启动延迟"""
+        loop = asyncio.get_running_loop()
+        pool = self._get_hash_pool()
+        await asyncio.gather(
+            *(loop.run_in_executor(pool, _warm_up_hasher) for _ in range(self.hash_workers))
+        )
+
+    def close_hash_pool(self):
+        """关闭密码哈希进程池"""
+        if self._hash_pool is not None:
+            self._hash_pool.shutdown(wait=False, cancel_futures=True)
+            self._hash_pool = None
 
-    # 密码相关
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """验证密码"""
-        return pwd_context.verify(plain_password, hashed_password)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._get_hash_pool(), _verify_password, plain_password, hashed_password
+        )
 
-    def get_password_hash(self, password: str) -> str:
+    async def get_password_hash(self, password: str) -> str:
         """生成密码哈希"""
-        return pwd_context.hash(password)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._get_hash_pool(), _hash_password, password)
 
     # JWT Token相关
     def create_access_token(self, data: Dict[str, Any]) -> str:
         """创建访问令牌"""
         to_encode = data.copy()
 
-        # 添加过期时间
-        expire = datetime.utcnow() + timedelta(minutes=self.access_token_expire_minutes)
+        # 添加过期时间（JWT 的 NumericDate 即整数秒时间戳）
+        now = int(time.time())
         to_encode.update(
             {
-                "exp": expire,
-                "iat": datetime.utcnow(),
+                "exp": now + self.access_token_expire_minutes * 60,
+                "iat": now,
                 "type": "access",
-                "jti": str(uuid.uuid4()),  # JWT ID，用于黑名单
+                "jti": secrets.token_urlsafe(16),  # JWT ID，用于黑名单（128位随机数）
             }
         )
 
-        return jwt.encode(to_encode, self.secret_key, algorithm=self.algorithm)
-
-    def create_refresh_token(self, user_id: str) -> str:
-        """创建刷新令牌"""
-        return secrets.token_urlsafe(32)
+        return self._encode_jwt(to_encode)
 
-    async def store_refresh_token(
-        self, session: AsyncSession, user_id: str, token: str
-    ) -> RefreshToken:
-        """存储刷新令牌"""
-        expires_at = datetime.utcnow() + timedelta(days=self.refresh_token_expire_days)
+    def create_refresh_token(self, user_id: str, token_version: int = 0) -> str:
+        """创建刷新令牌（自包含的JWT，刷新时无需查库）"""
+        now = int(time.time())
+        return self._encode_jwt(
+            {
+                "sub": user_id,
+                "ver": token_version,
+                "exp": now + self.refresh_token_expire_days * 86400,
+                "iat": now,
+                "type": "refresh",
+                "jti": secrets.token_urlsafe(16),
+            }
+        )
 
-        refresh_token = RefreshToken(token=token, user_id=user_id, expires_at=expires_at)
+    # JWT 的 payload 由 orjson 序列化/解析，PyJWS 只负责签名和验签
+    def _encode_jwt(self, claims: Dict[str, Any]) -> str:
+        """签发JWT"""
+        return jwt.api_jws.encode(orjson.dumps(claims), self.secret_key, algorithm=self.algorithm)
 
-        session.add(refresh_token)
-        await session.flush()
-        await session.refresh(refresh_token)
+    def _decode_jwt(self, token: str) -> Dict[str, Any]:
+        """验签并解析JWT，过期时抛出 ExpiredSignatureError"""
+        try:
+            payload = orjson.loads(
+                jwt.api_jws.decode(token, self.secret_key, algorithms=[self.algorithm])
+            )
+        except orjson.JSONDecodeError:
+            raise jwt.DecodeError("无效的payload")
 
-        return refresh_token
+        if not isinstance(payload, dict) or not isinstance(payload.get("exp"), int):
+            raise jwt.DecodeError("无效的payload")
+        if payload["exp"] <= time.time():
+            raise jwt.ExpiredSignatureError("Signature has expired")
+        return payload
 
     def decode_token(self, token: str) -> Dict[str, Any]:
-        """解码JWT令牌"""
+        """解码JWT访问令牌"""
         try:
-            payload = jwt.decode(
-                token, self.secret_key, algorithms=[self.algorithm], options={"verify_exp": True}
-            )
-            return payload
+            payload = self._decode_jwt(token)
         except jwt.ExpiredSignatureError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Token已过期",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-        except jwt.JWTError:
+        except jwt.InvalidTokenError:
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="无效的token",
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
-    async def verify_token(self, token: str) -> Dict[str, Any]:
-        """验证并解码token"""
-        payload = self.decode_token(token)
+        # 刷新令牌使用同一密钥签名，不能当作访问令牌使用
+        if payload.get("type") != "access":
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="无效的token",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return payload
 
-        # 检查token是否在黑名单
+    async def check_token_revoked(self, payload: Dict[str, Any]):
+        """检查已解码的token是否在黑名单"""
         jti = payload.get("jti")
         if jti and await cache_manager.is_token_blacklisted(jti):
             raise HTTPException(
@@ -117,10 +195,79 @@ class AuthManager:
                 headers={"WWW-Authenticate": "Bearer"},
             )
 
+    async def get_token_user(
+        self, session: AsyncSession, payload: Dict[str, Any]
+    ) -> Optional[User]:
+        """并发检查黑名单和查询用户（Redis 与数据库各一次往返，耗时取较慢者）"""
+        jti = payload.get("jti")
+        if not jti:
+            return await self.get_user_by_id(session, payload["sub"])
+
+        revoked, user = await asyncio.gather(
+            cache_manager.is_token_blacklisted(jti),
+            self.get_user_by_id(session, payload["sub"]),
+        )
+        if revoked or not self.token_version_matches(payload, user):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token已被撤销",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+        return user
+
+    async def get_cached_user(self, session: AsyncSession, token: str) -> Optional[User]:
+        """从验证缓存恢复用户，未命中返回None
+
+        验证缓存只在当前进程内有效，其他进程撤销的token不会清除这里的缓存，
+        所以命中时仍要检查黑名单和令牌版本（Redis 一次往返）
+        """
+        payload = get_cached_payload(token)
+        if payload is None:
+            return None
+
+        revoked, version = await cache_manager.get_token_state(payload.get("jti"), payload["sub"])
+        if revoked or (version is not None and payload.get("ver", 0) != version):
+            invalidate_token(token)
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token已被撤销",
+                headers={"WWW-Authenticate": "Bearer"},
+            )
+
+        return await load_cached_user(session, token)
+
+    @staticmethod
+    def token_version_matches(payload: Dict[str, Any], user: Optional[User]) -> bool:
+        """检查token的版本是否仍然有效（用户不存在时交给调用方处理）"""
+        return user is None or payload.get("ver", 0) == user.token_version
+
+    async def revoke_all_tokens(self, session: AsyncSession, user_id: str):
+        """撤销用户所有已签发的令牌（递增令牌版本）"""
+        version = await session.scalar(
+            update(User)
+            .where(User.id == user_id)
+            .values(token_version=User.token_version + 1)
+            .returning(User.token_version)
+            .execution_options(synchronize_session=False)
+        )
+        invalidate_user(user_id)
+        # 其他进程的验证缓存通过 Redis 中的版本号得知旧令牌已失效
+        if version is not None:
+            await cache_manager.set_token_version(user_id, version)
+
+    async def verify_token(self, token: str) -> Dict[str, Any]:
+        """验证并解码token"""
+        payload = self.decode_token(token)
+
+        # 检查token是否在黑名单
+        await self.check_token_revoked(payload)
+
         return payload
 
     async def revoke_token(self, token: str):
         """撤销token（加入黑名单）"""
+        invalidate_token(token)
+
         try:
             payload = self.decode_token(token)
             jti = payload.get("jti")
@@ -128,7 +275,7 @@ class AuthManager:
                 # 计算剩余过期时间
                 exp = payload.get("exp")
                 if exp:
-                    expire_time = exp - int(datetime.utcnow().timestamp())
+                    expire_time = exp - int(time.time())
                     if expire_time > 0:
                         await cache_manager.blacklist_token(jti, expire_time)
         except:
@@ -146,11 +293,28 @@ class AuthManager:
         if not user or not user.hashed_password:
             return None
 
-        if not self.verify_password(password, user.hashed_password):
+        if not await self.verify_password(password, user.hashed_password):
             return None
 
+        # 哈希算法或参数已过时，用本次的明文重新生成
+        if pwd_context.needs_update(user.hashed_password):
+            user.hashed_password = await self.get_password_hash(password)
+
         return user
 
+    async def touch_last_seen(self, user_id: str):
+        """更新最后登录时间（使用独立会话，供登录后的后台任务调用）"""
+        try:
+            async with db_manager.get_session() as session:
+                await session.execute(
+                    update(User)
+                    .where(User.id == user_id)
+                    .values(last_seen=func.now())
+                    .execution_options(synchronize_session=False)
+                )
+        except Exception as e:
+            logger.error(f"更新最后登录时间失败 {user_id}: {e}")
+
     async def get_user_by_id(self, session: AsyncSession, user_id: str) -> Optional[User]:
         """根据ID获取用户"""
         stmt = select(User).where(User.id == user_id, User.status == UserStatus.ACTIVE)
@@ -176,15 +340,16 @@ class AuthManager:
     ) -> User:
         """创建用户"""
 
-        # 检查邮箱是否已存在
-        existing_user = await self.get_user_by_email(session, email)
-        if existing_user:
+        # 一次查询同时检查邮箱和用户名是否已存在
+        stmt = (
+            select(User.email, User.username)
+            .where(or_(User.email == email, User.username == username))
+            .limit(2)
+        )
+        conflicts = (await session.execute(stmt)).all()
+        if any(row.email == email for row in conflicts):
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="邮箱已被使用")
-
-        # 检查用户名是否已存在
-        stmt = select(User).where(User.username == username)
-        result = await session.execute(stmt)
-        if result.scalar_one_or_none():
+        if conflicts:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="用户名已被使用")
 
         # 创建用户
@@ -200,13 +365,16 @@ class AuthManager:
         }
 
         if password:
-            user_data["hashed_password"] = self.get_password_hash(password)
+            user_data["hashed_password"] = await self.get_password_hash(password)
 
         user = User(**user_data)
         session.add(user)
         await session.flush()
         await session.refresh(user)
 
+        # 事务提交成功后再更新统计计数器，回滚时计数器不受影响
+        after_commit(session, cache_manager.record_new_user)
+
         return user
 
     async def generate_tokens(self, session: AsyncSession, user: User) -> Dict[str, str]:
@@ -218,16 +386,13 @@ class AuthManager:
             "email": user.email,
             "username": user.username,
             "display_name": user.display_name,
+            "ver": user.token_version,
         }
         access_token = self.create_access_token(access_token_data)
 
-        # 创建刷新令牌
-        refresh_token = self.create_refresh_token(user.id)
-        await self.store_refresh_token(session, user.id, refresh_token)
-
         return {
             "access_token": access_token,
-            "refresh_token": refresh_token,
+            "refresh_token": self.create_refresh_token(user.id, user.token_version),
             "token_type": "bearer",
         }
 
@@ -236,25 +401,26 @@ class AuthManager:
     ) -> Dict[str, str]:
         """使用刷新令牌获取新的访问令牌"""
 
-        # 查找刷新令牌
-        stmt = select(RefreshToken).where(
-            RefreshToken.token == refresh_token,
-            RefreshToken.is_revoked == False,
-            RefreshToken.expires_at > datetime.utcnow(),
-        )
-        result = await session.execute(stmt)
-        token_record = result.scalar_one_or_none()
+        # 本地验签，不查库
+        try:
+            payload = self._decode_jwt(refresh_token)
+        except jwt.InvalidTokenError:
+            payload = None
 
-        if not token_record:
+        if not payload or payload.get("type") != "refresh" or not payload.get("jti"):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的刷新令牌")
+
+        # 撤销旧的刷新令牌：原子地写入黑名单，已在黑名单中说明被用过或已撤销
+        remaining = payload["exp"] - int(time.time())
+        if not await cache_manager.consume_token(payload["jti"], max(remaining, 1)):
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的刷新令牌")
 
         # 获取用户
-        user = await self.get_user_by_id(session, token_record.user_id)
+        user = await self.get_user_by_id(session, payload["sub"])
         if not user:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="用户不存在")
-
-        # 撤销旧的刷新令牌
-        token_record.is_revoked = True
+        if not self.token_version_matches(payload, user):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="无效的刷新令牌")
 
         # 生成新的令牌对
         return await self.generate_tokens(session, user)
@@ -268,35 +434,62 @@ class OAuth2Manager:
         self.google_client_secret = settings.google_client_secret
         self.github_client_id = settings.github_client_id
         self.github_client_secret = settings.github_client_secret
+        self._http: Optional[httpx.AsyncClient] = None
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        """共享的HTTP客户端（首次使用时创建），复用到OAuth提供商的连接"""
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                timeout=10.0, limits=httpx.Limits(max_keepalive_connections=50)
+            )
+        return self._http
+
+    async def close(self):
+        """关闭HTTP客户端"""
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
 
     async def get_google_user_info(self, access_token: str) -> Dict[str, Any]:
         """获取Google用户信息"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://www.googleapis.com/oauth2/v2/userinfo",
-                headers={"Authorization": f"Bearer {access_token}"},
-            )
+        response = await self.http.get(
+            "https://www.googleapis.com/oauth2/v2/userinfo",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
 
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, detail="无法获取Google用户信息"
-                )
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="无法获取Google用户信息"
+            )
 
-            return response.json()
+        return response.json()
 
     async def get_github_user_info(self, access_token: str) -> Dict[str, Any]:
         """获取GitHub用户信息"""
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                "https://api.github.com/user", headers={"Authorization": f"Bearer {access_token}"}
+        response = await self.http.get(
+            "https://api.github.com/user", headers={"Authorization": f"Bearer {access_token}"}
+        )
+
+        if response.status_code != 200:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail="无法获取GitHub用户信息"
             )
 
-            if response.status_code != 200:
-                raise HTTPException(
-                    status_code=status.HTTP_400_BAD_REQUEST, detail="无法获取GitHub用户信息"
-                )
+        return response.json()
+
+    async def get_github_primary_email(self, access_token: str) -> Optional[str]:
+        """获取GitHub主邮箱，获取失败返回None"""
+        response = await self.http.get(
+            "https://api.github.com/user/emails",
+            headers={"Authorization": f"Bearer {access_token}"},
+        )
 
-            return response.json()
+        if response.status_code != 200:
+            return None
+
+        primary_email = next((e for e in response.json() if e["primary"]), None)
+        return primary_email["email"] if primary_email else None
 
     async def process_oauth_login(
         self,
@@ -317,30 +510,21 @@ class OAuth2Manager:
             username = email.split("@")[0]  # 简单的用户名生成
 
         elif provider == OAuthProvider.GITHUB:
-            user_info = await self.get_github_user_info(access_token)
+            # GitHub可能不返回公开邮箱，邮箱列表与用户信息并发请求
+            user_info, primary_email = await asyncio.gather(
+                self.get_github_user_info(access_token),
+                self.get_github_primary_email(access_token),
+            )
             oauth_id = str(user_info["id"])
-            email = user_info.get("email")
+            email = user_info.get("email") or primary_email
             display_name = user_info.get("name") or user_info["login"]
             avatar_url = user_info.get("avatar_url")
             username = user_info["login"]
 
             if not email:
-                # GitHub可能不返回邮箱，需要额外请求
-                async with httpx.AsyncClient() as client:
-                    email_response = await client.get(
-                        "https://api.github.com/user/emails",
-                        headers={"Authorization": f"Bearer {access_token}"},
-                    )
-                    if email_response.status_code == 200:
-                        emails = email_response.json()
-                        primary_email = next((e for e in emails if e["primary"]), None)
-                        if primary_email:
-                            email = primary_email["email"]
-
-                if not email:
-                    raise HTTPException(
-                        status_code=status.HTTP_400_BAD_REQUEST, detail="无法获取GitHub邮箱"
-                    )
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST, detail="无法获取GitHub邮箱"
+                )
         else:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="不支持的OAuth提供商")
 
@@ -367,14 +551,14 @@ class OAuth2Manager:
                     )
             else:
                 # 创建新用户
-                # 确保用户名唯一
+                # 确保用户名唯一：一次查出所有同前缀的用户名，取最小可用的数字后缀
+                stmt = select(User.username).where(
+                    User.username.startswith(username, autoescape=True)
+                )
+                taken = set((await session.execute(stmt)).scalars())
                 base_username = username
                 counter = 1
-                while True:
-                    stmt = select(User).where(User.username == username)
-                    result = await session.execute(stmt)
-                    if not result.scalar_one_or_none():
-                        break
+                while username in taken:
                     username = f"{base_username}{counter}"
                     counter += 1
 
@@ -388,9 +572,6 @@ class OAuth2Manager:
                     avatar_url=avatar_url,
                 )
 
-        # 更新最后登录时间
-        user.last_seen = datetime.utcnow()
-
         # 生成令牌
         tokens = await auth_manager.generate_tokens(session, user)
 
@@ -414,24 +595,29 @@ oauth_manager = OAuth2Manager()
 
 # 依赖注入函数
 async def get_current_user(
+    session: DbSession,
     credentials: HTTPAuthorizationCredentials = Depends(security),
-    session: AsyncSession = Depends(get_db),
 ) -> User:
     """获取当前用户（依赖注入）"""
+    token = credentials.credentials
+
+    # 命中验证缓存时跳过签名校验和用户查询（黑名单仍然检查）
+    user = await auth_manager.get_cached_user(session, token)
+    if user:
+        return user
 
     # 验证token
-    payload = await auth_manager.verify_token(credentials.credentials)
-    user_id = payload.get("sub")
+    payload = auth_manager.decode_token(token)
 
-    if not user_id:
+    if not payload.get("sub"):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="无效的token payload",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    # 获取用户
-    user = await auth_manager.get_user_by_id(session, user_id)
+    # 检查黑名单并获取用户
+    user = await auth_manager.get_token_user(session, payload)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -439,6 +625,7 @@ async def get_current_user(
             headers={"WWW-Authenticate": "Bearer"},
         )
 
+    cache_auth(token, payload, user)
     return user
 
 
@@ -449,10 +636,12 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
     return current_user
 
 
+# 路由参数类型：current_user: CurrentUser
+CurrentUser = Annotated[User, Depends(get_current_active_user)]
+
+
 # 可选的用户认证（用于WebSocket等场景）
-async def get_optional_user(
-    request: Request, session: AsyncSession = Depends(get_db)
-) -> Optional[User]:
+async def get_optional_user(request: Request, session: DbSession) -> Optional[User]:
     """可选的用户认证"""
     try:
         # 从查询参数或头部获取token
@@ -462,11 +651,17 @@ async def get_optional_user(
             if token.startswith("Bearer "):
                 token = token[7:]
 
-            payload = await auth_manager.verify_token(token)
-            user_id = payload.get("sub")
+            user = await auth_manager.get_cached_user(session, token)
+            if user:
+                return user
+
+            payload = auth_manager.decode_token(token)
 
-            if user_id:
-                return await auth_manager.get_user_by_id(session, user_id)
+            if payload.get("sub"):
+                user = await auth_manager.get_token_user(session, payload)
+                if user:
+                    cache_auth(token, payload, user)
+                return user
     except:
         pass
 
@@ -0,0 +1,72 @@
+"""
+JWT 验证结果缓存
+同一个token在短时间内重复请求时，跳过签名校验和用户查询（黑名单仍由调用方检查）
+"""
+import hashlib
+import time
+from typing import Any, Dict, Optional
+
+from cachetools import TLRUCache
+from sqlalchemy import inspect
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+
+from .models import User
+
+# 缓存有效期（秒），修改用户信息后最多延迟这么久在其他进程生效
+TOKEN_CACHE_TTL = 30
+TOKEN_CACHE_MAXSIZE = 10000
+
+_USER_COLUMNS = tuple(attr.key for attr in inspect(User).column_attrs)
+
+
+def _time_to_use(key: str, value: Dict[str, Any], now: float) -> float:
+    """缓存过期时间：不超过 TTL，也不超过 token 本身的过期时间"""
+    ttl = TOKEN_CACHE_TTL
+    exp = value["payload"].get("exp")
+    if exp:
+        ttl = min(ttl, exp - time.time())
+    return now + ttl
+
+
+_token_cache = TLRUCache(maxsize=TOKEN_CACHE_MAXSIZE, ttu=_time_to_use)
+
+
+def token_cache_key(token: str) -> str:
+    """缓存键使用token的哈希，不在内存中保存原始token"""
+    return hashlib.sha256(token.encode()).hexdigest()[:32]
+
+
+def cache_auth(token: str, payload: Dict[str, Any], user: User):
+    """缓存验证通过的token和用户快照"""
+    snapshot = {key: getattr(user, key) for key in _USER_COLUMNS}
+    _token_cache[token_cache_key(token)] = {"payload": payload, "user": snapshot}
+
+
+def get_cached_payload(token: str) -> Optional[Dict[str, Any]]:
+    """获取缓存的token payload，未命中返回None"""
+    entry = _token_cache.get(token_cache_key(token))
+    return entry["payload"] if entry else None
+
+
+async def load_cached_user(session: AsyncSession, token: str) -> Optional[User]:
+    """从缓存恢复用户并关联到当前会话（不查询数据库），未命中返回None"""
+    entry = _token_cache.get(token_cache_key(token))
+    if not entry:
+        return None
+
+    user = User(**entry["user"])
+    make_transient_to_detached(user)
+    return await session.merge(user, load=False)
+
+
+def invalidate_token(token: str):
+    """删除指定token的缓存"""
+    _token_cache.pop(token_cache_key(token), None)
+
+
+def invalidate_user(user_id: str):
+    """删除指定用户所有token的缓存"""
+    for key, entry in list(_token_cache.items()):
+        if entry["user"]["id"] == user_id:
+            _token_cache.pop(key, None)
@@ -1,12 +1,11 @@
 """
 Redis 缓存管理
 """
-import json
 import logging
-import pickle
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional, Union
+from typing import Any, Dict, List, Optional, Tuple, Union
 
+import orjson
 import redis.asyncio as redis
 from redis.asyncio import Redis
 
@@ -14,29 +13,69 @@ from .config import settings
 
 logger = logging.getLogger(__name__)
 
+# 按天统计的消息计数器保留48小时
+STATS_DAILY_EXPIRE = 48 * 3600
+
+# 热路径上用到的过期时间在导入时读取一次，配置在进程运行期间不会变化
+DEFAULT_EXPIRE = settings.redis_expire_seconds
+ONLINE_STATUS_EXPIRE = settings.websocket_timeout + 30
+TOKEN_BLACKLIST_EXPIRE = settings.access_token_expire_minutes * 60
+
+# 固定窗口计数：自增并仅在窗口内首次计数时设置过期时间，返回当前计数
+_INCR_WINDOW_LUA = """
+local current = redis.call('INCR', KEYS[1])
+if current == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[1])
+end
+return current
+"""
+
+# 通用缓存值统一按JSON编码：整数编码后仍可被 INCRBY 直接自增，
+# 读取时只需一次解码，不再猜测类型
+_DUMPS_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+
+def _dumps(value: Any) -> bytes:
+    """序列化缓存值"""
+    return orjson.dumps(value, option=_DUMPS_OPTIONS)
+
+
+def _loads(raw: str) -> Any:
+    """反序列化缓存值，非JSON的旧数据按原始字符串返回"""
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        return raw
+
 
 class CacheManager:
     """Redis缓存管理器"""
 
     def __init__(self):
-        self.redis: Optional[Redis] = None
+        # 客户端创建时不会建立连接，连接在首次执行命令时从连接池取得，
+        # 因此这里直接创建，各方法无需再检查客户端是否存在
+        self.pool = redis.BlockingConnectionPool.from_url(
+            settings.redis_url,
+            encoding="utf-8",
+            decode_responses=True,
+            max_connections=settings.redis_pool_size,
+            timeout=settings.redis_pool_timeout,
+            retry_on_timeout=True,
+            health_check_interval=30,
+        )
+        self.redis: Redis = Redis(connection_pool=self.pool)
+        # 脚本对象按 EVALSHA 调用，服务端没有缓存脚本时自动回退为 SCRIPT LOAD
+        self._incr_window_script = self.redis.register_script(_INCR_WINDOW_LUA)
         self._initialized = False
         self.key_prefix = "chatsphere:"
+        self._prefix_bytes = self.key_prefix.encode()
 
     async def initialize(self):
-        """初始化Redis连接"""
+        """检查Redis连接（应用启动时调用一次）"""
         if self._initialized:
             return
 
         try:
-            self.redis = redis.from_url(
-                settings.redis_url,
-                encoding="utf-8",
-                decode_responses=True,
-                max_connections=20,
-                retry_on_timeout=True,
-            )
-
             # 测试连接
             await self.redis.ping()
             logger.info("Redis连接已建立")
@@ -48,35 +87,23 @@ class CacheManager:
 
     async def close(self):
         """关闭Redis连接"""
-        if self.redis:
-            await self.redis.close()
-            logger.info("Redis连接已关闭")
-            self._initialized = False
+        await self.redis.close()
+        # 显式传入的连接池不会随客户端关闭，需要单独断开
+        await self.pool.disconnect()
+        logger.info("Redis连接已关闭")
+        self._initialized = False
 
-    def _make_key(self, key: str) -> str:
-        """生成带前缀的缓存键"""
-        return f"{self.key_prefix}{key}"
+    def _make_key(self, key: str) -> bytes:
+        """生成带前缀的缓存键（直接返回bytes，redis-py 不必再次编码）"""
+        return self._prefix_bytes + key.encode()
 
     # 基础缓存操作
     async def set(self, key: str, value: Any, expire: Optional[int] = None) -> bool:
         """设置缓存"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
-
-            # 序列化值
-            if isinstance(value, (dict, list)):
-                serialized_value = json.dumps(value, ensure_ascii=False)
-            elif isinstance(value, (str, int, float, bool)):
-                serialized_value = str(value)
-            else:
-                # 复杂对象使用pickle
-                serialized_value = pickle.dumps(value).decode("latin1")
-
-            expire_time = expire or settings.redis_expire_seconds
-            return await self.redis.set(cache_key, serialized_value, ex=expire_time)
+            expire_time = expire or DEFAULT_EXPIRE
+            return await self.redis.set(cache_key, _dumps(value), ex=expire_time)
 
         except Exception as e:
             logger.error(f"设置缓存失败 {key}: {e}")
@@ -84,9 +111,6 @@ class CacheManager:
 
     async def get(self, key: str, default: Any = None) -> Any:
         """获取缓存"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             value = await self.redis.get(cache_key)
@@ -94,17 +118,7 @@ class CacheManager:
             if value is None:
                 return default
 
-            # 尝试反序列化
-            try:
-                # 首先尝试JSON
-                return json.loads(value)
-            except (json.JSONDecodeError, TypeError):
-                try:
-                    # 然后尝试pickle
-                    return pickle.loads(value.encode("latin1"))
-                except:
-                    # 最后返回原始字符串
-                    return value
+            return _loads(value)
 
         except Exception as e:
             logger.error(f"获取缓存失败 {key}: {e}")
@@ -112,9 +126,6 @@ class CacheManager:
 
     async def delete(self, key: str) -> bool:
         """删除缓存"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             return bool(await self.redis.delete(cache_key))
@@ -124,9 +135,6 @@ class CacheManager:
 
     async def exists(self, key: str) -> bool:
         """检查缓存是否存在"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             return bool(await self.redis.exists(cache_key))
@@ -136,9 +144,6 @@ class CacheManager:
 
     async def expire(self, key: str, seconds: int) -> bool:
         """设置缓存过期时间"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             return bool(await self.redis.expire(cache_key, seconds))
@@ -148,9 +153,6 @@ class CacheManager:
 
     async def increment(self, key: str, amount: int = 1) -> int:
         """自增缓存值"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             return await self.redis.incrby(cache_key, amount)
@@ -158,18 +160,32 @@ class CacheManager:
             logger.error(f"自增缓存失败 {key}: {e}")
             return 0
 
+    async def increment_window(self, key: str, window: int) -> int:
+        """固定窗口计数，自增与设置过期时间由 Lua 脚本原子完成"""
+        try:
+            return await self._incr_window_script(keys=[self._make_key(key)], args=[window])
+        except Exception as e:
+            logger.error(f"窗口计数失败 {key}: {e}")
+            return 0
+
+    # 批量操作（单次往返）
+    async def delete_many(self, *keys: str) -> int:
+        """批量删除缓存（单条 DEL 命令）"""
+        if not keys:
+            return 0
+
+        try:
+            return await self.redis.delete(*(self._make_key(key) for key in keys))
+        except Exception as e:
+            logger.error(f"批量删除缓存失败: {e}")
+            return 0
+
     # 列表操作
     async def list_push(self, key: str, *values: Any) -> int:
         """向列表推送元素"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
-            serialized_values = [
-                json.dumps(v, ensure_ascii=False) if isinstance(v, (dict, list)) else str(v)
-                for v in values
-            ]
+            serialized_values = [_dumps(v) for v in values]
             return await self.redis.lpush(cache_key, *serialized_values)
         except Exception as e:
             logger.error(f"列表推送失败 {key}: {e}")
@@ -177,37 +193,20 @@ class CacheManager:
 
     async def list_pop(self, key: str) -> Any:
         """从列表弹出元素"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             value = await self.redis.rpop(cache_key)
-            if value:
-                try:
-                    return json.loads(value)
-                except:
-                    return value
-            return None
+            return _loads(value) if value is not None else None
         except Exception as e:
             logger.error(f"列表弹出失败 {key}: {e}")
             return None
 
     async def list_range(self, key: str, start: int = 0, end: int = -1) -> List[Any]:
         """获取列表范围"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             values = await self.redis.lrange(cache_key, start, end)
-            result = []
-            for value in values:
-                try:
-                    result.append(json.loads(value))
-                except:
-                    result.append(value)
-            return result
+            return [_loads(value) for value in values]
         except Exception as e:
             logger.error(f"获取列表范围失败 {key}: {e}")
             return []
@@ -215,15 +214,9 @@ class CacheManager:
     # 集合操作
     async def set_add(self, key: str, *members: Any) -> int:
         """向集合添加成员"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
-            serialized_members = [
-                json.dumps(m, ensure_ascii=False) if isinstance(m, (dict, list)) else str(m)
-                for m in members
-            ]
+            serialized_members = [_dumps(m) for m in members]
             return await self.redis.sadd(cache_key, *serialized_members)
         except Exception as e:
             logger.error(f"集合添加失败 {key}: {e}")
@@ -231,15 +224,9 @@ class CacheManager:
 
     async def set_remove(self, key: str, *members: Any) -> int:
         """从集合移除成员"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
-            serialized_members = [
-                json.dumps(m, ensure_ascii=False) if isinstance(m, (dict, list)) else str(m)
-                for m in members
-            ]
+            serialized_members = [_dumps(m) for m in members]
             return await self.redis.srem(cache_key, *serialized_members)
         except Exception as e:
             logger.error(f"集合移除失败 {key}: {e}")
@@ -247,19 +234,10 @@ class CacheManager:
 
     async def set_members(self, key: str) -> List[Any]:
         """获取集合所有成员"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             members = await self.redis.smembers(cache_key)
-            result = []
-            for member in members:
-                try:
-                    result.append(json.loads(member))
-                except:
-                    result.append(member)
-            return result
+            return [_loads(member) for member in members]
         except Exception as e:
             logger.error(f"获取集合成员失败 {key}: {e}")
             return []
@@ -267,54 +245,29 @@ class CacheManager:
     # 哈希操作
     async def hash_set(self, key: str, field: str, value: Any) -> bool:
         """设置哈希字段"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
-            serialized_value = (
-                json.dumps(value, ensure_ascii=False)
-                if isinstance(value, (dict, list))
-                else str(value)
-            )
-            return bool(await self.redis.hset(cache_key, field, serialized_value))
+            return bool(await self.redis.hset(cache_key, field, _dumps(value)))
         except Exception as e:
             logger.error(f"设置哈希字段失败 {key}.{field}: {e}")
             return False
 
     async def hash_get(self, key: str, field: str) -> Any:
         """获取哈希字段"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             value = await self.redis.hget(cache_key, field)
-            if value:
-                try:
-                    return json.loads(value)
-                except:
-                    return value
-            return None
+            return _loads(value) if value is not None else None
         except Exception as e:
             logger.error(f"获取哈希字段失败 {key}.{field}: {e}")
             return None
 
     async def hash_get_all(self, key: str) -> Dict[str, Any]:
         """获取哈希所有字段"""
-        if not self.redis:
-            await self.initialize()
-
         try:
             cache_key = self._make_key(key)
             values = await self.redis.hgetall(cache_key)
-            result = {}
-            for field, value in values.items():
-                try:
-                    result[field] = json.loads(value)
-                except:
-                    result[field] = value
-            return result
+            return {field: _loads(value) for field, value in values.items()}
         except Exception as e:
             logger.error(f"获取哈希所有字段失败 {key}: {e}")
             return {}
@@ -325,12 +278,24 @@ class ChatCacheManager(CacheManager):
 
     # 用户相关缓存
     async def cache_user_session(self, user_id: str, session_data: dict, expire: int = 3600):
-        """缓存用户会话"""
-        return await self.set(f"user_session:{user_id}", session_data, expire)
+        """缓存用户会话（每个字段存为哈希字段，DEL + HSET + EXPIRE 在一个事务中一次往返完成）"""
+        try:
+            key = self._make_key(f"user_session:{user_id}")
+            mapping = {field: _dumps(value) for field, value in session_data.items()}
+            async with self.redis.pipeline(transaction=True) as pipe:
+                # 先删除旧会话，避免残留上次登录的字段
+                pipe.delete(key)
+                pipe.hset(key, mapping=mapping)
+                pipe.expire(key, expire)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"缓存用户会话失败 {user_id}: {e}")
+            return False
 
     async def get_user_session(self, user_id: str) -> Optional[dict]:
         """获取用户会话"""
-        return await self.get(f"user_session:{user_id}")
+        return await self.hash_get_all(f"user_session:{user_id}") or None
 
     async def delete_user_session(self, user_id: str):
         """删除用户会话"""
@@ -340,7 +305,7 @@ class ChatCacheManager(CacheManager):
         """缓存用户在线状态"""
         key = f"user_online:{user_id}"
         if is_online:
-            return await self.set(key, "online", expire=settings.websocket_timeout + 30)
+            return await self.set(key, "online", expire=ONLINE_STATUS_EXPIRE)
         else:
             return await self.delete(key)
 
@@ -348,10 +313,70 @@ class ChatCacheManager(CacheManager):
         """检查用户是否在线"""
         return await self.exists(f"user_online:{user_id}")
 
+    async def clear_users_online_status(self, user_ids: List[str]) -> int:
+        """批量清除用户在线状态"""
+        return await self.delete_many(*(f"user_online:{user_id}" for user_id in user_ids))
+
+    # 在线用户列表（有序集合按上线时间排序，用户信息存放在哈希中）
+    async def add_online_user(self, user_id: str, user_info: dict, last_seen: float):
+        """记录在线用户"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zadd(self._make_key("online_users"), {user_id: last_seen})
+                pipe.hset(self._make_key("online_user_info"), user_id, orjson.dumps(user_info))
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"记录在线用户失败 {user_id}: {e}")
+            return False
+
+    async def remove_online_user(self, user_id: str):
+        """移除在线用户"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrem(self._make_key("online_users"), user_id)
+                pipe.hdel(self._make_key("online_user_info"), user_id)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"移除在线用户失败 {user_id}: {e}")
+            return False
+
+    async def remove_online_users(self, user_ids: List[str]):
+        """批量移除在线用户（只移除指定用户，列表为所有 worker 共享）"""
+        if not user_ids:
+            return True
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrem(self._make_key("online_users"), *user_ids)
+                pipe.hdel(self._make_key("online_user_info"), *user_ids)
+                await pipe.execute()
+            return True
+        except Exception as e:
+            logger.error(f"批量移除在线用户失败: {e}")
+            return False
+
+    async def get_online_users_page(self, offset: int, limit: int) -> Tuple[List[dict], int]:
+        """分页获取在线用户（按最近上线时间倒序），返回 (用户列表, 在线总数)"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.zrevrange(self._make_key("online_users"), offset, offset + limit - 1)
+                pipe.zcard(self._make_key("online_users"))
+                user_ids, total = await pipe.execute()
+
+            if not user_ids:
+                return [], total
+
+            infos = await self.redis.hmget(self._make_key("online_user_info"), user_ids)
+            return [orjson.loads(info) for info in infos if info is not None], total
+        except Exception as e:
+            logger.error(f"获取在线用户列表失败: {e}")
+            return [], 0
+
     # 房间相关缓存
-    async def add_user_to_room(self, room_id: str, user_id: str):
-        """将用户添加到房间"""
-        return await self.set_add(f"room_users:{room_id}", user_id)
+    async def add_user_to_room(self, room_id: str, *user_ids: str):
+        """将用户添加到房间（多个用户通过一条 SADD 添加）"""
+        return await self.set_add(f"room_users:{room_id}", *user_ids)
 
     async def remove_user_from_room(self, room_id: str, user_id: str):
         """从房间移除用户"""
@@ -361,6 +386,26 @@ class ChatCacheManager(CacheManager):
         """获取房间用户列表"""
         return await self.set_members(f"room_users:{room_id}")
 
+    async def get_room_user_count(self, room_id: str) -> int:
+        """获取房间在线用户数"""
+        try:
+            return await self.redis.scard(self._make_key(f"room_users:{room_id}"))
+        except Exception as e:
+            logger.error(f"获取房间用户数失败 {room_id}: {e}")
+            return 0
+
+    async def get_room_user_counts(self, room_ids: List[str]) -> Dict[str, int]:
+        """批量获取多个房间的在线用户数（单次往返，只取数量不取成员）"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for room_id in room_ids:
+                    pipe.scard(self._make_key(f"room_users:{room_id}"))
+                counts = await pipe.execute()
+            return dict(zip(room_ids, counts))
+        except Exception as e:
+            logger.error(f"批量获取房间用户数失败: {e}")
+            return {room_id: 0 for room_id in room_ids}
+
     async def cache_room_info(self, room_id: str, room_data: dict):
         """缓存房间信息"""
         return await self.set(f"room_info:{room_id}", room_data, expire=1800)
@@ -394,25 +439,50 @@ class ChatCacheManager(CacheManager):
     async def check_rate_limit(
         self, user_id: str, action: str, limit: int = 10, window: int = 60
     ) -> bool:
-        """检查速率限制"""
-        key = f"rate_limit:{action}:{user_id}"
-        current = await self.increment(key)
-
-        if current == 1:
-            await self.expire(key, window)
-
+        """检查速率限制（计数失败时返回0，按放行处理）"""
+        current = await self.increment_window(f"rate_limit:{action}:{user_id}", window)
         return current <= limit
 
     # JWT token 黑名单
     async def blacklist_token(self, token_jti: str, expire: int = None):
         """将JWT token加入黑名单"""
-        expire_time = expire or settings.access_token_expire_minutes * 60
+        expire_time = expire or TOKEN_BLACKLIST_EXPIRE
         return await self.set(f"blacklist_token:{token_jti}", "1", expire_time)
 
+    async def consume_token(self, token_jti: str, expire: int) -> bool:
+        """将一次性token加入黑名单（SET NX），返回False表示已在黑名单中或无法写入"""
+        try:
+            key = self._make_key(f"blacklist_token:{token_jti}")
+            return bool(await self.redis.set(key, "1", ex=expire, nx=True))
+        except Exception as e:
+            # 无法确认token未被使用过时拒绝，避免Redis故障期间刷新令牌可被重放
+            logger.error(f"写入token黑名单失败 {token_jti}: {e}")
+            return False
+
     async def is_token_blacklisted(self, token_jti: str) -> bool:
         """检查token是否在黑名单"""
         return await self.exists(f"blacklist_token:{token_jti}")
 
+    # 令牌版本：撤销用户全部令牌后记录新版本，供各进程校验验证缓存
+    async def set_token_version(self, user_id: str, version: int):
+        """记录用户当前的令牌版本（旧版本的访问令牌过期后记录也随之过期）"""
+        return await self.set(f"token_version:{user_id}", version, expire=TOKEN_BLACKLIST_EXPIRE)
+
+    async def get_token_state(
+        self, token_jti: Optional[str], user_id: str
+    ) -> Tuple[bool, Optional[int]]:
+        """一次往返检查token是否在黑名单并读取用户的令牌版本（未记录版本时为None）"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.get(self._make_key(f"token_version:{user_id}"))
+                if token_jti:
+                    pipe.exists(self._make_key(f"blacklist_token:{token_jti}"))
+                version, *revoked = await pipe.execute()
+            return any(revoked), int(version) if version is not None else None
+        except Exception as e:
+            logger.error(f"检查token状态失败 {user_id}: {e}")
+            return False, None
+
     # 验证码缓存
     async def cache_verification_code(self, email: str, code: str, expire: int = 300):
         """缓存验证码"""
@@ -426,21 +496,71 @@ class ChatCacheManager(CacheManager):
         """删除验证码"""
         return await self.delete(f"verification_code:{email}")
 
+    # 统计计数器（避免每次统计都对大表做 COUNT(*)）
+    async def init_stats_counters(
+        self, total_users: int, total_messages: int, today: str, today_messages: int
+    ):
+        """用数据库中的真实数量初始化统计计数器
+
+        只写入不存在的计数器（SET NX），多个worker同时启动或已有计数在递增时不会被覆盖
+        """
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(self._make_key("stats:total_users"), total_users, nx=True)
+                pipe.set(self._make_key("stats:total_messages"), total_messages, nx=True)
+                pipe.set(
+                    self._make_key(f"stats:messages:{today}"),
+                    today_messages,
+                    ex=STATS_DAILY_EXPIRE,
+                    nx=True,
+                )
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"初始化统计计数器失败: {e}")
+
+    async def record_new_user(self):
+        """用户总数计数器加一"""
+        return await self.increment("stats:total_users")
+
+    async def record_new_message(self, day: str):
+        """消息总数和当日消息数计数器加一"""
+        try:
+            daily_key = self._make_key(f"stats:messages:{day}")
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.incr(self._make_key("stats:total_messages"))
+                pipe.incr(daily_key)
+                pipe.expire(daily_key, STATS_DAILY_EXPIRE)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"更新消息计数器失败: {e}")
+
+    async def get_stats_counters(self, today: str) -> List[Optional[int]]:
+        """一次 MGET 读取 [用户总数, 消息总数, 当日消息数]，不存在的计数器返回 None"""
+        try:
+            values = await self.redis.mget(
+                self._make_key("stats:total_users"),
+                self._make_key("stats:total_messages"),
+                self._make_key(f"stats:messages:{today}"),
+            )
+            return [int(v) if v is not None else None for v in values]
+        except Exception as e:
+            logger.error(f"读取统计计数器失败: {e}")
+            return [None, None, None]
+
 
 # 全局缓存管理器实例
 cache_manager = ChatCacheManager()
 
 
 # 健康检查函数
-async def check_redis_health() -> dict:
-    """检查Redis健康状态"""
+async def check_redis_health(detailed: bool = False) -> dict:
+    """检查Redis健康状态（默认只 PING，detailed=True 时再读取 INFO）"""
     try:
-        if not cache_manager.redis:
-            await cache_manager.initialize()
+        if not detailed:
+            await cache_manager.redis.ping()
+            return {"status": "healthy", "redis": "connected"}
 
-        await cache_manager.redis.ping()
         info = await cache_manager.redis.info()
-
         return {
             "status": "healthy",
             "redis": "connected",
@@ -2,6 +2,7 @@
 ChatSphere 应用配置
 """
 import os
+from functools import cached_property
 from typing import List, Optional
 
 from pydantic import Field
@@ -34,6 +35,9 @@ class Settings(BaseSettings):
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 7
+    password_hash_workers: int = 0  # 密码哈希进程池大小，0表示CPU核数
+    # 受信任的反向代理（IP或CIDR），只有直连方在此列表中时才采用 X-Forwarded-For
+    trusted_proxies: List[str] = []
 
     # CORS配置
     allowed_origins: List[str] = [
@@ -57,6 +61,12 @@ class Settings(BaseSettings):
     postgres_port: int = 5432
     postgres_db: str = "chatsphere"
     postgres_echo: bool = False
+    db_pool_min: int = 10  # 启动时预先建立的连接数
+    # 每个worker的连接池大小，pool_size × worker数 + max_overflow × worker数 不应超过数据库 max_connections
+    db_pool_size: int = 20
+    db_max_overflow: int = 40
+    # 通过 PgBouncer（事务模式）连接时由 PgBouncer 负责连接复用，应用侧不再维护连接池
+    db_use_pgbouncer: bool = False
 
     # 添加 DATABASE_URL 环境变量支持
     database_url_env: Optional[str] = Field(None, alias="DATABASE_URL")
@@ -68,12 +78,20 @@ class Settings(BaseSettings):
             return self.database_url_env.replace("postgresql://", "postgresql+asyncpg://")
         return f"postgresql+asyncpg://{self.postgres_user}:{self.postgres_password}@{self.postgres_host}:{self.postgres_port}/{self.postgres_db}"
 
+    @cached_property
+    def database_url_masked(self) -> str:
+        """去掉账号密码的数据库地址（用于健康检查等对外展示）"""
+        url = self.database_url
+        return url.split("@", 1)[1] if "@" in url else "hidden"
+
     # Redis配置
     redis_host: str = "localhost"
     redis_port: int = 6379
     redis_password: Optional[str] = None
     redis_db: int = 0
     redis_expire_seconds: int = 3600
+    redis_pool_size: int = 50  # 每个worker的Redis连接数上限，连接用尽时等待而不是报错
+    redis_pool_timeout: int = 5
 
     # 添加 REDIS_URL 环境变量支持
     redis_url_env: Optional[str] = Field(None, alias="REDIS_URL")
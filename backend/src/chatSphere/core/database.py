@@ -1,14 +1,17 @@
 """
 数据库连接和会话管理
 """
+import asyncio
 import logging
 from contextlib import asynccontextmanager
 from functools import wraps
-from typing import AsyncGenerator, Optional
+from typing import Annotated, Any, AsyncGenerator, Awaitable, Callable, Dict, List, Optional
 
-from sqlalchemy import text
+from fastapi import Depends
+from sqlalchemy import delete, event, exists, insert, select, text, update
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import NullPool
 
 from .config import settings
 from .models import Base
@@ -31,13 +34,25 @@ class DatabaseManager:
 
         try:
             # 创建异步引擎
+            if settings.db_use_pgbouncer:
+                # 事务模式下同一会话的语句可能落在不同的后端连接上，需要关闭预编译语句缓存
+                pool_options = {
+                    "poolclass": NullPool,
+                    "connect_args": {
+                        "statement_cache_size": 0,
+                        "prepared_statement_cache_size": 0,
+                    },
+                }
+            else:
+                pool_options = {
+                    "pool_size": settings.db_pool_size,
+                    "max_overflow": settings.db_max_overflow,
+                    "pool_pre_ping": True,
+                    "pool_recycle": 3600,
+                }
+
             self.engine = create_async_engine(
-                settings.database_url,
-                echo=settings.postgres_echo,
-                pool_size=20,
-                max_overflow=30,
-                pool_pre_ping=True,
-                pool_recycle=3600,
+                settings.database_url, echo=settings.postgres_echo, **pool_options
             )
 
             # 创建会话工厂
@@ -72,6 +87,22 @@ class DatabaseManager:
             logger.error(f"创建数据库表失败: {e}")
             raise
 
+    async def warm_pool(self, size: int):
+        """预先建立连接池中的连接，避免首批请求承担建连开销"""
+        if not self.engine:
+            await self.initialize()
+
+        # NullPool 不保留连接，预热没有意义
+        if settings.db_use_pgbouncer:
+            return
+
+        try:
+            connections = await asyncio.gather(*(self.engine.connect() for _ in range(size)))
+            await asyncio.gather(*(conn.close() for conn in connections))
+            logger.info(f"数据库连接池已预热: {size} 个连接")
+        except Exception as e:
+            logger.warning(f"数据库连接池预热失败: {e}")
+
     async def drop_tables(self):
         """删除所有表（谨慎使用）"""
         if not self.engine:
@@ -99,8 +130,6 @@ class DatabaseManager:
                 await session.rollback()
                 logger.error(f"数据库会话错误: {e}")
                 raise
-            finally:
-                await session.close()
 
     async def get_session_no_commit(self) -> AsyncSession:
         """获取数据库会话（不自动提交）"""
@@ -121,6 +150,35 @@ class DatabaseManager:
 db_manager = DatabaseManager()
 
 
+# 事务提交后执行的异步回调（例如更新 Redis 计数器），回滚时丢弃
+_AFTER_COMMIT_KEY = "after_commit"
+_after_commit_tasks: set = set()
+
+
+def after_commit(session: AsyncSession, func: Callable[..., Awaitable[Any]], *args):
+    """登记在当前事务成功提交后才执行的异步操作"""
+    session.info.setdefault(_AFTER_COMMIT_KEY, []).append((func, args))
+
+
+@event.listens_for(Session, "after_commit")
+def _run_after_commit(session: Session):
+    callbacks = session.info.pop(_AFTER_COMMIT_KEY, None)
+    if not callbacks:
+        return
+
+    loop = asyncio.get_running_loop()
+    for func, args in callbacks:
+        task = loop.create_task(func(*args))
+        # 保留引用，避免任务在执行完之前被回收
+        _after_commit_tasks.add(task)
+        task.add_done_callback(_after_commit_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_after_commit(session: Session):
+    session.info.pop(_AFTER_COMMIT_KEY, None)
+
+
 # 依赖注入函数
 async def get_db() -> AsyncGenerator[AsyncSession, None]:
     """FastAPI 依赖注入：获取数据库会话"""
@@ -128,6 +186,10 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+# 路由参数类型：session: DbSession
+DbSession = Annotated[AsyncSession, Depends(get_db)]
+
+
 # 事务装饰器
 def transactional(func):
     """事务装饰器 - 自动处理事务提交和回滚"""
@@ -144,17 +206,10 @@ def transactional(func):
                 logger.error(f"事务执行失败: {e}")
                 raise
         else:
-            # 创建新的数据库会话
+            # 创建新的数据库会话，提交和回滚由 get_session 在退出时统一处理
             async with db_manager.get_session() as session:
                 kwargs["session"] = session
-                try:
-                    result = await func(*args, **kwargs)
-                    await session.commit()
-                    return result
-                except Exception as e:
-                    await session.rollback()
-                    logger.error(f"事务回滚: {e}")
-                    raise
+                return await func(*args, **kwargs)
 
     return wrapper
 
@@ -179,43 +234,58 @@ class BaseRepository:
 
     async def get_by_field(self, session: AsyncSession, field_name: str, value):
         """根据字段获取记录"""
-        from sqlalchemy import select
-
         stmt = select(self.model).where(getattr(self.model, field_name) == value)
         result = await session.execute(stmt)
         return result.scalar_one_or_none()
 
-    async def get_all(self, session: AsyncSession, limit: int = 100, offset: int = 0):
-        """获取所有记录"""
-        from sqlalchemy import select
-
-        stmt = select(self.model).limit(limit).offset(offset)
+    async def bulk_create(self, session: AsyncSession, rows: List[Dict[str, Any]]):
+        """批量创建记录（INSERT ... RETURNING，一批只需一次往返）"""
+        if not rows:
+            return []
+
+        result = await session.scalars(insert(self.model).returning(self.model), rows)
+        return result.all()
+
+    async def get_all(
+        self, session: AsyncSession, limit: int = 100, offset: int = 0, after_id=None
+    ):
+        """获取所有记录；传入 after_id 时按主键游标分页，避免大 OFFSET 扫描"""
+        if after_id is not None:
+            stmt = (
+                select(self.model)
+                .where(self.model.id > after_id)
+                .order_by(self.model.id)
+                .limit(limit)
+            )
+        else:
+            stmt = select(self.model).limit(limit).offset(offset)
         result = await session.execute(stmt)
         return result.scalars().all()
 
     async def update(self, session: AsyncSession, id: str, **kwargs):
-        """更新记录"""
-        instance = await session.get(self.model, id)
-        if instance:
-            for key, value in kwargs.items():
-                if hasattr(instance, key):
-                    setattr(instance, key, value)
-            await session.flush()
-            await session.refresh(instance)
-        return instance
+        """更新记录（UPDATE ... RETURNING 一次往返完成，返回更新后的记录）"""
+        values = {key: value for key, value in kwargs.items() if hasattr(self.model, key)}
+        if not values:
+            return await self.get_by_id(session, id)
+
+        stmt = (
+            update(self.model)
+            .where(self.model.id == id)
+            .values(**values)
+            .returning(self.model)
+            .execution_options(populate_existing=True)
+        )
+        result = await session.execute(stmt)
+        return result.scalar_one_or_none()
 
     async def delete(self, session: AsyncSession, id: str):
-        """删除记录"""
-        instance = await session.get(self.model, id)
-        if instance:
-            await session.delete(instance)
-            await session.flush()
-        return instance
+        """删除记录（DELETE ... RETURNING 一次往返完成，返回被删除的记录）"""
+        stmt = delete(self.model).where(self.model.id == id).returning(self.model)
+        result = await session.execute(stmt)
+        return result.scalar_one_or_none()
 
     async def exists(self, session: AsyncSession, **kwargs):
         """检查记录是否存在"""
-        from sqlalchemy import exists, select
-
         conditions = [getattr(self.model, key) == value for key, value in kwargs.items()]
         stmt = select(exists().where(*conditions))
         result = await session.execute(stmt)
@@ -231,9 +301,7 @@ async def check_database_health() -> dict:
             return {
                 "status": "healthy",
                 "database": "connected",
-                "url": settings.database_url.split("@")[1]
-                if "@" in settings.database_url
-                else "hidden",
+                "url": settings.database_url_masked,
             }
     except Exception as e:
         return {"status": "unhealthy", "database": "disconnected", "error": str(e)}
@@ -1,6 +1,9 @@
+import atexit
 import logging.config
 import os  # 导入 os 模块
-from typing import Dict
+import queue
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
 
 from .config import settings
 
@@ -17,6 +20,13 @@ COLORED_LOG_FORMAT = "%(log_color)s[%(asctime)s] [%(name)s] [%(levelname)s] - %(
 # 普通文件日志格式
 FILE_LOG_FORMAT = "[%(asctime)s] [%(name)s] [%(levelname)s] - %(message)s"
 
+# 需要改为经由队列输出的记录器
+QUEUED_LOGGERS = ("", "uvicorn", "uvicorn.error", "uvicorn.access")
+
+# 日志队列和后台监听器：真正的控制台/文件写入在监听线程中完成，不阻塞事件循环
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_queue_listener: Optional[QueueListener] = None
+
 
 def get_logging_config() -> Dict:
     """
@@ -84,7 +94,12 @@ def get_logging_config() -> Dict:
 def setup_logging():
     """
     应用日志配置。在 FastAPI 应用启动时调用此函数。
+    每个进程只配置一次：main 模块可能被再次导入（python main.py 启动时），
+    重复配置会重新打开日志文件并重建监听线程。
     """
+    if _queue_listener is not None:
+        return
+
     # 在应用配置之前，先确保日志目录存在
     log_dir = "logs"
     # 我们从配置字典中动态获取日志文件名，避免硬编码
@@ -97,3 +112,33 @@ def setup_logging():
         os.makedirs(log_dir, exist_ok=True)
 
     logging.config.dictConfig(config)
+    _start_queue_listener()
+
+
+def _start_queue_listener():
+    """
+    将记录器的处理器替换为 QueueHandler，由后台 QueueListener 线程执行实际的 I/O。
+    """
+    global _queue_listener
+
+    # dictConfig 为各记录器配置的是同一组处理器，取 root 上的即可
+    handlers = list(logging.getLogger().handlers)
+    queue_handler = QueueHandler(_log_queue)
+
+    for name in QUEUED_LOGGERS:
+        logging.getLogger(name).handlers = [queue_handler]
+
+    _queue_listener = QueueListener(_log_queue, *handlers, respect_handler_level=True)
+    _queue_listener.start()
+
+
+def _stop_queue_listener():
+    """停止后台日志监听器并写出队列中剩余的日志"""
+    global _queue_listener
+
+    if _queue_listener is not None:
+        _queue_listener.stop()
+        _queue_listener = None
+
+
+atexit.register(_stop_queue_listener)
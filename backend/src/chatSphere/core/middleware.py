@@ -9,12 +9,16 @@ from datetime import datetime
 from typing import Any, Callable, Dict
 
 from fastapi import HTTPException, Request, Response, status
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse
 from starlette.middleware.base import BaseHTTPMiddleware
 from starlette.responses import JSONResponse
 
+from ..services.responses import INTERNAL_ERROR_BODY
 from .auth import auth_manager
 from .cache import cache_manager
 from .config import settings
+from .rate_limit import client_ip
 
 logger = logging.getLogger(__name__)
 
@@ -131,29 +135,17 @@ class RateLimitMiddleware(BaseHTTPMiddleware):
             except:
                 pass
 
-        # 使用IP地址
-        client_ip = request.headers.get("X-Forwarded-For", request.client.host)
-        return f"ip:{client_ip}"
+        # 使用IP地址（仅信任已配置代理转发的 X-Forwarded-For）
+        return f"ip:{client_ip(request)}"
 
     async def check_rate_limit(self, client_id: str) -> bool:
         """检查速率限制"""
         try:
-            key = f"rate_limit:{client_id}"
-
-            # 获取当前计数
-            current_count = await cache_manager.get(key, 0)
-
-            if current_count >= self.requests_per_minute:
-                return False
-
-            # 增加计数
-            new_count = await cache_manager.increment(key)
-
-            # 设置过期时间（仅在第一次时）
-            if new_count == 1:
-                await cache_manager.expire(key, self.window_size)
-
-            return True
+            # 自增与首次设置过期时间在一次往返内完成
+            current_count = await cache_manager.increment_window(
+                f"rate_limit:{client_id}", self.window_size
+            )
+            return current_count <= self.requests_per_minute
 
         except Exception as e:
             logger.error(f"速率限制检查失败: {e}")
@@ -358,13 +350,9 @@ class ErrorHandlingMiddleware(BaseHTTPMiddleware):
             )
 
             # 返回统一的错误响应
-            return JSONResponse(
+            return ORJSONResponse(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                content={
-                    "error": "Internal Server Error",
-                    "message": "服务器内部错误，请稍后重试",
-                    "request_id": request_id,
-                },
+                content={**INTERNAL_ERROR_BODY, "data": {"request_id": request_id}},
             )
 
 
@@ -402,6 +390,9 @@ def setup_middleware(app):
 
     # 暂时只保留必要的中间件来解决CORS问题
 
+    # 响应压缩（与 nginx 的 gzip_min_length 保持一致，小于1KB的响应压缩收益不大）
+    app.add_middleware(GZipMiddleware, minimum_size=1024, compresslevel=6)
+
     # 请求日志中间件
     app.add_middleware(RequestLoggingMiddleware)
 
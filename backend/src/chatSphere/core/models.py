@@ -102,6 +102,8 @@ class User(Base):
     hashed_password = Column(String(255), nullable=True)  # OAuth用户可能没有密码
     oauth_provider: Column[OAuthProvider] = Column(Enum(OAuthProvider), default=OAuthProvider.LOCAL)
     oauth_id = Column(String(255), nullable=True)
+    # 令牌版本，递增后该用户之前签发的所有令牌失效
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")
 
     # 用户信息
     avatar_url = Column(String(500), nullable=True)
@@ -252,9 +254,11 @@ class Message(Base):
     __table_args__ = (
         Index("idx_message_from_user", "from_user_id", "created_at"),
         Index("idx_message_to_user", "to_user_id", "created_at"),
+        Index("idx_message_private", "from_user_id", "to_user_id", "created_at"),
         Index("idx_message_group", "group_id", "created_at"),
         Index("idx_message_room", "room_id", "created_at"),
         Index("idx_message_chat_type", "chat_type", "created_at"),
+        Index("idx_message_created", "created_at"),
     )
 
 
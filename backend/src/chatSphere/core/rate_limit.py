@@ -0,0 +1,78 @@
+"""
+进程内令牌桶限流
+在访问 Redis 之前先做本地限流，被拒绝的请求不产生网络往返；
+本地桶放行的请求仍交给 Redis 计数，保证多进程间的全局限制
+"""
+import ipaddress
+import time
+
+from cachetools import TTLCache
+from fastapi import Request
+
+from .config import settings
+
+# 令牌桶条目在窗口时间后一定已经回满，直接过期即可，不需要额外清理
+_BUCKETS_MAXSIZE = 100000
+
+
+class TokenBucket:
+    """按键区分的令牌桶，容量 capacity，每 window 秒回满"""
+
+    def __init__(self, capacity: int, window: int):
+        self.capacity = capacity
+        self.rate = capacity / window
+        self._buckets: TTLCache = TTLCache(maxsize=_BUCKETS_MAXSIZE, ttl=window)
+
+    def allow(self, key: str) -> bool:
+        """消耗一个令牌，桶为空时返回False"""
+        now = time.monotonic()
+        tokens, last = self._buckets.get(key, (self.capacity, now))
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+
+        if tokens < 1:
+            self._buckets[key] = (tokens, now)
+            return False
+
+        self._buckets[key] = (tokens - 1, now)
+        return True
+
+
+_TRUSTED_PROXIES = tuple(
+    ipaddress.ip_network(proxy, strict=False) for proxy in settings.trusted_proxies
+)
+
+
+def _is_trusted_proxy(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return any(address in network for network in _TRUSTED_PROXIES)
+
+
+def client_ip(request: Request) -> str:
+    """获取客户端IP
+
+    X-Forwarded-For 可以被客户端随意伪造，只有直连方是受信任代理时才采用；
+    从右往左跳过受信任代理，第一个不受信任的地址即为真实客户端
+    """
+    host = request.client.host if request.client else "unknown"
+    if not _is_trusted_proxy(host):
+        return host
+
+    forwarded_for = request.headers.get("X-Forwarded-For")
+    if not forwarded_for:
+        return host
+
+    for candidate in reversed(forwarded_for.split(",")):
+        candidate = candidate.strip()
+        if candidate and not _is_trusted_proxy(candidate):
+            return candidate
+    return host
+
+
+# 登录限流：5分钟内最多5次尝试
+LOGIN_RATE_LIMIT = 5
+LOGIN_RATE_WINDOW = 300
+
+login_bucket = TokenBucket(LOGIN_RATE_LIMIT, LOGIN_RATE_WINDOW)
@@ -2,19 +2,25 @@
 简化版WebSocket连接管理器
 """
 import asyncio
-import json
 import logging
+import time
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
+import orjson
 from fastapi import WebSocket
+from sqlalchemy import update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from ..services.conversation_service import update_conversation_with_new_message
 from .cache import cache_manager
-from .models import User
+from .models import ChatType, Message, MessageType, User
 
 logger = logging.getLogger(__name__)
 
+# 连接锁分片数：同一用户的连接/断开串行执行，不同用户互不影响
+CONNECTION_LOCK_STRIPES = 16
+
 
 class ConnectionManager:
     """WebSocket连接管理器"""
@@ -26,18 +32,41 @@ class ConnectionManager:
         # 用户信息：user_id -> User
         self.user_sessions: Dict[str, User] = {}
 
+        # 按 user_id 分片的连接锁
+        self._locks = [asyncio.Lock() for _ in range(CONNECTION_LOCK_STRIPES)]
+
+    def _lock_for(self, user_id: str) -> asyncio.Lock:
+        """获取用户对应的连接锁"""
+        return self._locks[hash(user_id) % CONNECTION_LOCK_STRIPES]
+
+    @property
+    def connection_count(self) -> int:
+        """当前活跃连接数"""
+        return len(self.active_connections)
+
     async def connect(self, websocket: WebSocket, user: User, session: AsyncSession):
         """用户连接"""
-        # 如果用户已连接，先断开旧连接
-        if user.id in self.active_connections:
-            await self.force_disconnect(user.id)
+        async with self._lock_for(user.id):
+            # 如果用户已连接，先断开旧连接
+            if user.id in self.active_connections:
+                await self.force_disconnect(user.id)
 
-        # 存储连接
-        self.active_connections[user.id] = websocket
-        self.user_sessions[user.id] = user
+            # 存储连接
+            self.active_connections[user.id] = websocket
+            self.user_sessions[user.id] = user
 
         # 更新用户在线状态
         await cache_manager.cache_user_online_status(user.id, True)
+        await cache_manager.add_online_user(
+            user.id,
+            {
+                "id": user.id,
+                "username": user.username,
+                "display_name": user.display_name,
+                "avatar_url": user.avatar_url,
+            },
+            time.time(),
+        )
 
         # 更新数据库中的最后在线时间
         user.last_seen = datetime.utcnow()
@@ -73,17 +102,25 @@ class ConnectionManager:
         # 广播在线用户列表给所有用户
         await self.broadcast_online_users()
 
-    async def disconnect(self, user_id: str, session: AsyncSession):
-        """用户断开连接"""
-        if user_id not in self.active_connections:
-            return
+    async def disconnect(
+        self, user_id: str, session: AsyncSession, websocket: Optional[WebSocket] = None
+    ):
+        """用户断开连接（传入 websocket 时，只在它仍是该用户的当前连接时才断开）"""
+        async with self._lock_for(user_id):
+            if user_id not in self.active_connections:
+                return
+
+            # 旧连接已被同一用户的新连接替换，不能影响新连接
+            if websocket is not None and self.active_connections[user_id] is not websocket:
+                return
 
-        # 移除连接
-        del self.active_connections[user_id]
-        user = self.user_sessions.pop(user_id, None)
+            # 移除连接
+            del self.active_connections[user_id]
+            user = self.user_sessions.pop(user_id, None)
 
         # 更新缓存中的在线状态
         await cache_manager.cache_user_online_status(user_id, False)
+        await cache_manager.remove_online_user(user_id)
 
         # 从所有房间中移除用户（从默认房间开始）
         try:
@@ -92,9 +129,12 @@ class ConnectionManager:
         except Exception as e:
             logger.error(f"从房间移除用户失败: {e}")
 
-        # 更新数据库中的最后在线时间
+        # 更新数据库中的最后在线时间（user 来自建立连接时的会话，这里按主键直接更新）
         if user:
             user.last_seen = datetime.utcnow()
+            await session.execute(
+                update(User).where(User.id == user_id).values(last_seen=user.last_seen)
+            )
             await session.commit()
 
         logger.info(f"用户 {user_id} 已断开连接")
@@ -104,23 +144,25 @@ class ConnectionManager:
 
     async def force_disconnect(self, user_id: str):
         """强制断开用户连接"""
-        if user_id in self.active_connections:
+        # 先移除再关闭，关闭期间其他协程不会再拿到这个连接
+        websocket = self.active_connections.pop(user_id, None)
+        self.user_sessions.pop(user_id, None)
+        if websocket:
             try:
-                await self.active_connections[user_id].close()
+                await websocket.close()
             except:
                 pass
-            del self.active_connections[user_id]
-            if user_id in self.user_sessions:
-                del self.user_sessions[user_id]
 
     async def disconnect_all(self):
         """断开所有连接"""
-        for user_id in list(self.active_connections.keys()):
+        # force_disconnect 会清空 user_sessions，需要先记下所有用户
+        user_ids = list(self.active_connections.keys())
+        for user_id in user_ids:
             await self.force_disconnect(user_id)
 
-        # 清理缓存
-        for user_id in list(self.user_sessions.keys()):
-            await cache_manager.cache_user_online_status(user_id, False)
+        # 清理缓存：只移除本 worker 持有的用户，其他 worker 的在线用户不受影响
+        await cache_manager.clear_users_online_status(user_ids)
+        await cache_manager.remove_online_users(user_ids)
 
     async def send_to_user(self, user_id: str, message: dict) -> bool:
         """发送消息给指定用户"""
@@ -129,7 +171,8 @@ class ConnectionManager:
 
         try:
             websocket = self.active_connections[user_id]
-            await websocket.send_text(json.dumps(message, ensure_ascii=False))
+            # 前端按文本帧解析JSON，这里用 orjson 序列化后仍以文本帧发送
+            await websocket.send_text(orjson.dumps(message).decode())
             return True
         except Exception as e:
             logger.error(f"发送消息给用户 {user_id} 失败: {e}")
@@ -137,13 +180,34 @@ class ConnectionManager:
             await self.force_disconnect(user_id)
             return False
 
-    async def handle_message(self, user_id: str, data: str, session: AsyncSession):
-        """处理用户消息"""
+    async def broadcast(self, user_ids: List[str], message: dict, exclude: Optional[str] = None):
+        """广播消息给多个用户（只序列化一次，并发发送）"""
+        targets = [
+            (target_user_id, self.active_connections[target_user_id])
+            for target_user_id in user_ids
+            if target_user_id != exclude and target_user_id in self.active_connections
+        ]
+        if not targets:
+            return
+
+        payload = orjson.dumps(message).decode()
+        results = await asyncio.gather(
+            *(websocket.send_text(payload) for _, websocket in targets), return_exceptions=True
+        )
+
+        # 移除发送失败的连接
+        for (target_user_id, websocket), result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.error("发送消息给用户 %s 失败: %s", target_user_id, result)
+                if self.active_connections.get(target_user_id) is websocket:
+                    await self.force_disconnect(target_user_id)
+
+    async def handle_message(self, user_id: str, message_data: dict, session: AsyncSession):
+        """处理用户消息（message_data 为已解析的JSON对象）"""
         try:
-            message_data = json.loads(data)
             message_type = message_data.get("type", "")
 
-            logger.info(f"收到用户 {user_id} 的消息: {message_data}")
+            logger.debug("收到用户 %s 的消息: %s", user_id, message_data)
 
             # 处理不同类型的消息
             if message_type == "send_message":
@@ -163,8 +227,6 @@ class ConnectionManager:
                     user_id, {"type": "error", "data": {"message": f"未知的消息类型: {message_type}"}}
                 )
 
-        except json.JSONDecodeError:
-            await self.send_to_user(user_id, {"type": "error", "data": {"message": "无效的JSON格式"}})
         except Exception as e:
             logger.error(f"处理用户 {user_id} 消息失败: {e}")
             await self.send_to_user(user_id, {"type": "error", "data": {"message": "消息处理失败"}})
@@ -187,8 +249,6 @@ class ConnectionManager:
 
         try:
             # 保存消息到数据库
-            from .models import ChatType, Message, MessageType
-
             # 确定消息类型和目标
             db_message = Message(
                 from_user_id=user_id,
@@ -212,12 +272,13 @@ class ConnectionManager:
             await session.commit()
             await session.refresh(db_message)
 
-            logger.info(f"消息已保存到数据库: {db_message.id}")
+            logger.debug("消息已保存到数据库: %s", db_message.id)
+
+            # 更新统计计数器
+            await cache_manager.record_new_message(datetime.utcnow().date().isoformat())
 
             # 更新会话信息（未读数等）
             try:
-                from ..services.conversation_service import update_conversation_with_new_message
-
                 await update_conversation_with_new_message(
                     session, user_id, chat_type, chat_id, db_message.id
                 )
@@ -247,26 +308,21 @@ class ConnectionManager:
                 "timestamp": datetime.utcnow().isoformat(),
             }
 
-            logger.info(f"广播消息: {broadcast_message}")
+            logger.debug("广播消息: %s", broadcast_message)
 
             # 根据聊天类型选择性广播
             target_users_for_broadcast = []
             if chat_type == "room":
                 # 房间消息：广播给所有在线用户（房间是公开的）
                 target_users_for_broadcast = list(self.active_connections.keys())
-                for target_user_id in target_users_for_broadcast:
-                    await self.send_to_user(target_user_id, broadcast_message)
             elif chat_type == "private":
                 # 私聊消息：只发送给发送者和接收者
                 target_users_for_broadcast = [user_id, chat_id]  # chat_id是接收者的用户ID
-                for target_user_id in target_users_for_broadcast:
-                    if target_user_id in self.active_connections:
-                        await self.send_to_user(target_user_id, broadcast_message)
             elif chat_type == "group":
                 # 群组消息：TODO - 需要查询群组成员，暂时广播给所有人
                 target_users_for_broadcast = list(self.active_connections.keys())
-                for target_user_id in target_users_for_broadcast:
-                    await self.send_to_user(target_user_id, broadcast_message)
+
+            await self.broadcast(target_users_for_broadcast, broadcast_message)
 
             # 广播会话更新通知，让相关用户刷新会话列表
             conversation_update_message = {
@@ -280,12 +336,10 @@ class ConnectionManager:
                 "timestamp": datetime.utcnow().isoformat(),
             }
 
-            logger.info(f"广播会话更新通知: {conversation_update_message}")
+            logger.debug("广播会话更新通知: %s", conversation_update_message)
 
             # 向相关用户发送会话更新通知
-            for target_user_id in target_users_for_broadcast:
-                if target_user_id in self.active_connections:
-                    await self.send_to_user(target_user_id, conversation_update_message)
+            await self.broadcast(target_users_for_broadcast, conversation_update_message)
 
         except Exception as e:
             logger.error(f"保存消息到数据库失败: {e}")
@@ -315,9 +369,7 @@ class ConnectionManager:
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-        for target_user_id in self.active_connections:
-            if target_user_id != user_id:
-                await self.send_to_user(target_user_id, broadcast_message)
+        await self.broadcast(list(self.active_connections), broadcast_message, exclude=user_id)
 
     async def handle_join_room(self, user_id: str, message_data: dict):
         """处理加入房间"""
@@ -347,9 +399,7 @@ class ConnectionManager:
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-        for target_user_id in self.active_connections:
-            if target_user_id != user_id:
-                await self.send_to_user(target_user_id, join_message)
+        await self.broadcast(list(self.active_connections), join_message, exclude=user_id)
 
     async def handle_leave_room(self, user_id: str, message_data: dict):
         """处理离开房间"""
@@ -379,9 +429,7 @@ class ConnectionManager:
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-        for target_user_id in self.active_connections:
-            if target_user_id != user_id:
-                await self.send_to_user(target_user_id, leave_message)
+        await self.broadcast(list(self.active_connections), leave_message, exclude=user_id)
 
     async def handle_typing(self, user_id: str, message_data: dict):
         """处理打字状态"""
@@ -406,9 +454,7 @@ class ConnectionManager:
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-        for target_user_id in self.active_connections:
-            if target_user_id != user_id:
-                await self.send_to_user(target_user_id, typing_message)
+        await self.broadcast(list(self.active_connections), typing_message, exclude=user_id)
 
     async def handle_ping(self, user_id: str):
         """处理心跳"""
@@ -431,6 +477,10 @@ class ConnectionManager:
 
         return online_users
 
+    async def get_online_users_page(self, limit: int, offset: int = 0) -> Tuple[List[dict], int]:
+        """分页获取在线用户列表（从Redis读取，不遍历本地连接）"""
+        return await cache_manager.get_online_users_page(offset, limit)
+
     async def broadcast_online_users(self):
         """广播在线用户列表"""
         online_users = await self.get_online_users()
@@ -441,10 +491,10 @@ class ConnectionManager:
             "timestamp": datetime.utcnow().isoformat(),
         }
 
-        for user_id in self.active_connections:
-            await self.send_to_user(user_id, message)
+        await self.broadcast(list(self.active_connections), message)
 
     async def cleanup_expired_connections(self):
         """清理过期连接"""
-        # 简化版本：暂时不实现
+        # 在线用户列表由所有 worker 共享，启动时不能整体清空，
+        # 否则会抹掉其他 worker 上仍在线的用户；各 worker 关闭时自行清理
         pass
@@ -6,8 +6,10 @@ import logging
 
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import func
 
+from ..core.cache import cache_manager
 from ..core.models import ChatType, Conversation, user_group_association, user_room_association
 
 logger = logging.getLogger(__name__)
@@ -37,8 +39,6 @@ async def update_conversation_with_new_message(
             # 房间：为所有在线用户创建/更新会话记录
             # 从缓存中获取当前房间的所有在线用户
             try:
-                from ..core.cache_manager import cache_manager
-
                 online_room_users = await cache_manager.get_room_users(chat_id)
                 relevant_users = online_room_users
 
@@ -155,11 +155,16 @@ async def mark_conversation_as_read(
 
 async def get_user_conversations_with_details(session: AsyncSession, user_id: str, limit: int = 20):
     """获取用户的会话列表，包含详细信息"""
-    from ..core.models import Group, Message, Room, User
-
     try:
+        # 预加载关联对象，避免逐条会话查询（N+1）
         stmt = (
             select(Conversation)
+            .options(
+                selectinload(Conversation.other_user),
+                selectinload(Conversation.group),
+                selectinload(Conversation.room),
+                selectinload(Conversation.last_message),
+            )
             .where(Conversation.user_id == user_id, Conversation.is_archived == False)
             .order_by(Conversation.updated_at.desc())
             .limit(limit)
@@ -176,17 +181,14 @@ async def get_user_conversations_with_details(session: AsyncSession, user_id: st
                 "unread_count": conv.unread_count,
                 "is_pinned": conv.is_pinned,
                 "is_muted": conv.is_muted,
-                "updated_at": conv.updated_at.isoformat(),
+                "updated_at": conv.updated_at,
                 "name": "",  # 会话显示名称
                 "chat_id": "",  # 实际的聊天ID
             }
 
             # 添加聊天对象信息和名称
             if conv.chat_type == ChatType.PRIVATE and conv.other_user_id:
-                # 获取对方用户信息
-                user_stmt = select(User).where(User.id == conv.other_user_id)
-                user_result = await session.execute(user_stmt)
-                other_user = user_result.scalar_one_or_none()
+                other_user = conv.other_user
 
                 if other_user:
                     conv_data["chat_id"] = other_user.id
@@ -199,10 +201,7 @@ async def get_user_conversations_with_details(session: AsyncSession, user_id: st
                     }
 
             elif conv.chat_type == ChatType.GROUP and conv.group_id:
-                # 获取群组信息
-                group_stmt = select(Group).where(Group.id == conv.group_id)
-                group_result = await session.execute(group_stmt)
-                group = group_result.scalar_one_or_none()
+                group = conv.group
 
                 if group:
                     conv_data["chat_id"] = group.id
@@ -214,10 +213,7 @@ async def get_user_conversations_with_details(session: AsyncSession, user_id: st
                     }
 
             elif conv.chat_type == ChatType.ROOM and conv.room_id:
-                # 获取房间信息
-                room_stmt = select(Room).where(Room.id == conv.room_id)
-                room_result = await session.execute(room_stmt)
-                room = room_result.scalar_one_or_none()
+                room = conv.room
 
                 if room:
                     conv_data["chat_id"] = room.id
@@ -225,18 +221,14 @@ async def get_user_conversations_with_details(session: AsyncSession, user_id: st
                     conv_data["room"] = {"id": room.id, "name": room.name}
 
             # 添加最后一条消息
-            if conv.last_message_id:
-                msg_stmt = select(Message).where(Message.id == conv.last_message_id)
-                msg_result = await session.execute(msg_stmt)
-                last_message = msg_result.scalar_one_or_none()
-
-                if last_message:
-                    conv_data["last_message"] = {
-                        "content": last_message.content,
-                        "created_at": last_message.created_at.isoformat(),
-                        "from_user_id": last_message.from_user_id,
-                        "message_type": last_message.message_type.value,
-                    }
+            last_message = conv.last_message
+            if last_message:
+                conv_data["last_message"] = {
+                    "content": last_message.content,
+                    "created_at": last_message.created_at,
+                    "from_user_id": last_message.from_user_id,
+                    "message_type": last_message.message_type.value,
+                }
 
             # 只添加有效的会话（有名称的）
             if conv_data["name"]:
@@ -143,6 +143,28 @@ class ErrorDetail(BaseModel):
     value: Any = None
 
 
+# 字段格式校验失败时返回的业务错误（保持与原先手动校验相同的响应格式）
+FIELD_ERROR_RESPONSES = {
+    "password": (ResponseCode.WEAK_PASSWORD, ResponseMessage.WEAK_PASSWORD, "至少6位字符"),
+    "username": (ResponseCode.BAD_REQUEST, "用户名格式不正确", "至少3位，只能包含字母和数字"),
+}
+FIELD_ERROR_TYPES = {"string_too_short", "string_pattern_mismatch"}
+
+
+def format_field_error(errors: list) -> Optional[ApiResponse]:
+    """请求体字段格式错误转换为对应的业务错误，没有匹配的字段时返回None"""
+    for error in errors:
+        loc = error["loc"]
+        if loc[0] != "body" or error["type"] not in FIELD_ERROR_TYPES:
+            continue
+        if loc[-1] in FIELD_ERROR_RESPONSES:
+            code, message, requirement = FIELD_ERROR_RESPONSES[loc[-1]]
+            return ApiResponse.error(
+                message=message, code=code, data={"field": loc[-1], "requirement": requirement}
+            )
+    return None
+
+
 def format_validation_errors(errors: list) -> ApiResponse:
     """格式化验证错误"""
     error_details = []
@@ -177,11 +199,13 @@ HTTP_STATUS_MAP = {
     ResponseCode.USER_NOT_FOUND: 404,
     ResponseCode.USER_ALREADY_EXISTS: 409,
     ResponseCode.INVALID_CREDENTIALS: 401,
+    ResponseCode.ACCOUNT_DISABLED: 400,
     ResponseCode.EMAIL_ALREADY_EXISTS: 409,
     ResponseCode.USERNAME_ALREADY_EXISTS: 409,
     ResponseCode.WEAK_PASSWORD: 400,
     ResponseCode.INVALID_TOKEN: 401,
     ResponseCode.TOKEN_EXPIRED: 401,
+    ResponseCode.REFRESH_TOKEN_INVALID: 401,
     ResponseCode.ROOM_NOT_FOUND: 404,
     ResponseCode.ROOM_ACCESS_DENIED: 403,
     ResponseCode.INTERNAL_ERROR: 500,
@@ -189,3 +213,19 @@ HTTP_STATUS_MAP = {
     ResponseCode.CACHE_ERROR: 500,
     ResponseCode.EXTERNAL_SERVICE_ERROR: 503,
 }
+
+# HTTPException 的 detail 到业务错误码的映射
+HTTP_EXCEPTION_CODES = {
+    "邮箱已被使用": ResponseCode.EMAIL_ALREADY_EXISTS,
+    "用户名已被使用": ResponseCode.USERNAME_ALREADY_EXISTS,
+    "无效的token": ResponseCode.INVALID_TOKEN,
+    "Token已过期": ResponseCode.TOKEN_EXPIRED,
+    "Token已被撤销": ResponseCode.INVALID_TOKEN,
+    "无效的刷新令牌": ResponseCode.REFRESH_TOKEN_INVALID,
+    "用户账户已被禁用": ResponseCode.ACCOUNT_DISABLED,
+}
+
+# 未处理异常的统一响应体
+INTERNAL_ERROR_BODY = ApiResponse.error(
+    message=ResponseMessage.INTERNAL_ERROR, code=ResponseCode.INTERNAL_ERROR
+).dict()
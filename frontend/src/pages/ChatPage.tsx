@@ -286,9 +286,14 @@ const ConversationSidebar = ({ onChatSelect, selectedChatId, selectedChatType }:
 const MessageBubble = ({ message, isOwn }: { message: any; isOwn: boolean }) => {
   const { state } = useChat();
 
-  // 从在线用户列表中获取用户信息
+  // 从在线用户列表中获取用户信息，离线用户使用消息中携带的发送者信息
   const sender = state.onlineUsers.find(user => user.id === message.from_user_id);
-  const senderName = sender?.display_name || sender?.username || '未知用户';
+  const senderName =
+    sender?.display_name ||
+    sender?.username ||
+    message.from_display_name ||
+    message.from_username ||
+    '未知用户';
 
   // 格式化时间
   const formatTime = (dateString: string) => {
@@ -51,6 +51,14 @@ export interface Message {
   created_at: string;
   is_edited: boolean;
   reply_to_id?: string;
+  from_username?: string;
+  from_display_name?: string;
+  from_avatar_url?: string;
+}
+
+export interface MessageCursor {
+  before_ts: string;
+  before_id: number;
 }
 
 export interface Room {
@@ -165,15 +173,20 @@ class ApiService {
   }
 
   // 获取房间在线人数
-  async getRoomOnlineCount(roomId: string): Promise<{ room_id: string; online_count: number; online_users: User[] }> {
+  async getRoomOnlineCount(roomId: string): Promise<{ room_id: string; online_count: number; online_users: string[] | null }> {
     const response = await this.api.get(`/rooms/${roomId}/online-count`);
     return response.data;
   }
 
   // 消息相关API
-  async getMessages(chatType: string, chatId: string, limit = 50, offset = 0): Promise<{messages: Message[], total: number, has_more: boolean}> {
+  async getMessages(
+    chatType: string,
+    chatId: string,
+    limit = 50,
+    cursor?: MessageCursor | null
+  ): Promise<{messages: Message[], total: number, has_more: boolean, next_cursor: MessageCursor | null}> {
     const response = await this.api.get(`/messages/${chatType}/${chatId}`, {
-      params: { limit, offset }
+      params: { limit, ...(cursor ?? {}) }
     });
     return response.data;
   }